@@ -13,9 +13,42 @@
 """
 
 from abc import ABC, abstractmethod
+import asyncio
 import json
-import xml.etree.ElementTree as ET
+import logging
+import mmap
+import os
+import random
+import re
+import select
+import struct
+import sys
+import tempfile
+import time
+import weakref
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from functools import lru_cache
+from http.client import HTTPConnection, HTTPSConnection, RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count, islice
+from json.encoder import encode_basestring_ascii
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import BoundedSemaphore, Lock, Thread
+from urllib.parse import urlsplit
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 
 # 目标接口 - 应用程序期望的接口
@@ -36,23 +69,97 @@ class PaymentProcessor(ABC):
     def check_payment_status(self, payment_id):
         """查询支付状态"""
         pass
+    
+    def process_payments_bulk(self, payments, max_workers=8):
+        """批量支付
+
+        payments 为 (金额, 卡号, 有效期, CVV) 序列，按输入顺序返回结果列表。
+        默认实现以最多 max_workers 个并发逐笔调用 process_payment，
+        支持批量接口的适配器应重写此方法。
+        """
+        return list(_bounded_map(lambda payment: self.process_payment(*payment), payments, max_workers))
+    
+    def check_payment_statuses_bulk(self, payment_ids, max_workers=8):
+        """批量查询支付状态，返回 {支付ID: 状态}
+
+        默认实现以最多 max_workers 个并发逐个调用 check_payment_status。
+        """
+        payment_ids = list(payment_ids)
+        return dict(zip(payment_ids, _bounded_map(self.check_payment_status, payment_ids, max_workers)))
+
+
+def _bounded_map(func, items, max_workers):
+    """并发执行 func，按输入顺序产出结果，同时在途的任务不超过 max_workers 的两倍"""
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending = deque(executor.submit(func, item) for item in islice(iterator, max_workers * 2))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(iterator, 1):
+                pending.append(executor.submit(func, item))
+            yield result
+
+
+def _batches(items, batch_size):
+    """将 items 切分为长度不超过 batch_size 的列表"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _zip_batch(batch, responses):
+    """批量响应按请求顺序返回，与请求中的支付ID逐个对应；以调用方传入的ID作为键，与逐个查询时一致"""
+    responses = list(responses)
+    if len(responses) != len(batch):
+        raise ValueError(f"批量响应数 {len(responses)} 与请求数 {len(batch)} 不符")
+    return zip(batch, responses)
+
+
+def _failed_before_gateway(error):
+    """判断失败是否确定发生在网关处理请求之前：请求没有发出、连接被拒绝，或网关以 4xx 拒绝了请求"""
+    if isinstance(error, (RequestNotSentError, ConnectionRefusedError)):
+        return True
+    return isinstance(error, GatewayHTTPError) and 400 <= error.status < 500
 
 
 # 客户端代码 - 使用目标接口
 class PaymentService:
-    """支付服务 - 客户端"""
+    """支付服务 - 客户端
+
+    传入 idempotency_store 后，make_payment 可以带上 idempotency_key：
+    同一个键的重试直接返回首次支付的结果，不会再次调用网关。
+    请求没有发出（RequestNotSentError）、连接被拒绝或网关返回 4xx 时释放幂等键，可以用同一个键重试；
+    超时等无法确定是否已扣款的失败保持处理中，重试抛出 IdempotencyError。
+    """
     
-    def __init__(self, payment_processor):
+    def __init__(self, payment_processor, idempotency_store=None):
         self.payment_processor = payment_processor
+        self.idempotency_store = idempotency_store
     
-    def make_payment(self, amount, card_details):
+    def make_payment(self, amount, card_details, idempotency_key=None):
         """使用支付处理器进行支付"""
-        return self.payment_processor.process_payment(
-            amount,
-            card_details["card_number"],
-            card_details["expiry_date"],
-            card_details["cvv"]
-        )
+        card_number = card_details["card_number"]
+        expiry_date = card_details["expiry_date"]
+        cvv = card_details["cvv"]
+        if idempotency_key is not None:
+            if self.idempotency_store is None:
+                raise ValueError("使用 idempotency_key 需要配置 idempotency_store")
+            stored = self.idempotency_store.begin(idempotency_key)
+            if stored is not None:
+                return stored
+        try:
+            result = self.payment_processor.process_payment(amount, card_number, expiry_date, cvv)
+        except Exception as error:
+            # 只有确定请求未被网关处理时才释放；超时等结果未知的失败保持处理中，重试得到 IdempotencyError
+            if idempotency_key is not None and _failed_before_gateway(error):
+                self.idempotency_store.release(idempotency_key)
+            raise
+        if idempotency_key is not None:
+            self.idempotency_store.complete(idempotency_key, result)
+        return result
     
     def request_refund(self, payment_id, amount=None):
         """请求退款"""
@@ -61,187 +168,1317 @@ class PaymentService:
     def get_payment_status(self, payment_id):
         """获取支付状态"""
         return self.payment_processor.check_payment_status(payment_id)
+    
+    def make_payments_bulk(self, payments):
+        """批量支付，payments 为 (金额, 卡信息) 序列，按输入顺序返回结果"""
+        return self.payment_processor.process_payments_bulk(
+            (amount, card_details["card_number"], card_details["expiry_date"], card_details["cvv"])
+            for amount, card_details in payments
+        )
+    
+    def get_payment_statuses_bulk(self, payment_ids):
+        """批量获取支付状态，返回 {支付ID: 状态}"""
+        return self.payment_processor.check_payment_statuses_bulk(payment_ids)
+
+
+# 幂等存储 - 记录幂等键对应的支付结果，客户端重试时直接返回
+class IdempotencyError(Exception):
+    """幂等键对应的请求正在处理中，或在进程崩溃前未完成、结果未知"""
+
+
+class IdempotencyStore:
+    """基于预写日志的幂等存储
+
+    每个记录追加到 path 指向的日志文件：调用网关前写入"处理中"记录，
+    完成后写入结果，失败时写入"释放"记录。内存中只保存 {幂等键: 结果在日志中的位置}，
+    结果通过内存映射按需读取，查询为 O(1)。打开时扫描日志恢复索引，
+    崩溃时写了一半的尾部记录会被截掉。sync=True 时每次写入后 fsync，
+    返回即意味着记录已落盘。compact() 重写日志，只保留每个键的最新记录。
+    """
+    
+    # 头部: crc32, 状态, 键长度, 值长度, 写入时间（Unix 秒）
+    _HEADER = struct.Struct("<IBHId")
+    PENDING, COMPLETED, RELEASED = 0, 1, 2
+    
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync
+        self._lock = Lock()
+        self._open()
+    
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._map = None
+        self._index = {}  # 幂等键 -> (状态, 值偏移, 值长度, 写入时间)
+        self._size = self._recover()
+    
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ) if self._size else None
+    
+    def _recover(self):
+        """扫描日志重建索引，返回有效数据的长度"""
+        size = os.fstat(self._fd).st_size
+        self._size = size
+        self._remap()
+        header, data, offset = self._HEADER, self._map, 0
+        while offset + header.size <= size:
+            crc, state, key_length, value_length, created = header.unpack_from(data, offset)
+            end = offset + header.size + key_length + value_length
+            if end > size or zlib.crc32(data[offset + 4:end]) != crc:
+                break
+            key_start = offset + header.size
+            key = data[key_start:key_start + key_length].decode()
+            if state == self.RELEASED:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = (state, key_start + key_length, value_length, created)
+            offset = end
+        if offset < size:
+            # 尾部记录不完整或已损坏（写入时崩溃），截掉后继续追加
+            os.ftruncate(self._fd, offset)
+            self._size = offset
+            self._remap()
+        return offset
+    
+    def _append(self, key, state, value=b"", created=None):
+        key_bytes = key.encode()
+        created = time.time() if created is None else created
+        body = self._HEADER.pack(0, state, len(key_bytes), len(value), created)[4:] + key_bytes + value
+        os.write(self._fd, struct.pack("<I", zlib.crc32(body)) + body)
+        if self.sync:
+            os.fsync(self._fd)
+        offset = self._size + self._HEADER.size + len(key_bytes)
+        self._size += 4 + len(body)
+        if state == self.RELEASED:
+            self._index.pop(key, None)
+        else:
+            self._index[key] = (state, offset, len(value), created)
+    
+    def begin(self, key):
+        """开始处理幂等键：已有结果时返回结果，否则记录为处理中并返回 None
+
+        键正在处理中（包括崩溃前未完成的请求）时抛出 IdempotencyError。
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self._append(key, self.PENDING)
+                return None
+            if entry[0] == self.PENDING:
+                raise IdempotencyError(f"幂等键 {key} 的请求正在处理中或结果未知")
+            return self._read(entry)
+    
+    def complete(self, key, result):
+        """保存幂等键的处理结果"""
+        with self._lock:
+            self._append(key, self.COMPLETED, json.dumps(result, separators=(",", ":")).encode())
+    
+    def release(self, key):
+        """处理失败，删除幂等键，之后可以用同一个键重试"""
+        with self._lock:
+            self._append(key, self.RELEASED)
+    
+    def get(self, key):
+        """返回已保存的结果，没有时返回 None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or entry[0] != self.COMPLETED:
+                return None
+            return self._read(entry)
+    
+    def _read(self, entry):
+        _, offset, length, _ = entry
+        if self._map is None or offset + length > len(self._map):
+            self._remap()
+        return json.loads(self._map[offset:offset + length])
+    
+    def compact(self, older_than=None):
+        """重写日志，只保留每个键的最新记录；older_than（秒）指定时同时删除更早写入的记录"""
+        with self._lock:
+            cutoff = None if older_than is None else time.time() - older_than
+            temp_path = self.path + ".compact"
+            self._remap()
+            with open(temp_path, "wb") as file:
+                for key, (state, offset, length, created) in self._index.items():
+                    if cutoff is not None and created < cutoff:
+                        continue
+                    key_bytes = key.encode()
+                    body = (self._HEADER.pack(0, state, len(key_bytes), length, created)[4:]
+                            + key_bytes + self._map[offset:offset + length])
+                    file.write(struct.pack("<I", zlib.crc32(body)) + body)
+                file.flush()
+                os.fsync(file.fileno())
+            self._close()
+            os.replace(temp_path, self.path)
+            self._open()
+    
+    def __len__(self):
+        return len(self._index)
+    
+    def __contains__(self, key):
+        return key in self._index
+    
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        os.close(self._fd)
+    
+    def close(self):
+        with self._lock:
+            self._close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# 支付ID - 时间有序、跨进程不冲突的64位ID
+class PaymentIdGenerator:
+    """雪花算法风格的支付ID生成器
+
+    64位ID由高到低为：41位毫秒时间戳（从 EPOCH_MS 起算）、10位节点号、12位序号。
+    同一毫秒内序号递增，序号用尽或系统时钟回拨时借用下一毫秒，因此同一生成器产生的ID
+    严格递增且不会阻塞。不同进程或主机应使用不同的 node_id（0 ~ 1023）。
+
+    未指定 node_id 时，第一次生成ID时在 lease_dir 目录（默认为临时目录下按用户区分的
+    payment-id-nodes-<uid>）中租用一个节点号：对 node-<号>.lock 文件加排他锁，
+    锁在进程退出时由操作系统释放，因此同一主机上同时存活的进程不会拿到相同的节点号；
+    无法打开的锁文件（如属于其他用户）视为已被占用。fork 出的子进程在下次生成ID时重新租用。
+    多台主机共用ID空间时仍需为每台主机显式分配 node_id 范围。
+    """
+    
+    EPOCH_MS = 1672531200000  # 2023-01-01T00:00:00Z
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+    MAX_NODE_ID = (1 << NODE_BITS) - 1
+    _SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+    _lease = None  # 租约文件描述符
+    
+    def __init__(self, node_id=None, clock=time.time_ns, lease_dir=None):
+        if node_id is not None and not 0 <= node_id <= self.MAX_NODE_ID:
+            raise ValueError(f"node_id 必须在 0 ~ {self.MAX_NODE_ID} 之间: {node_id}")
+        self.clock = clock
+        self.lease_dir = lease_dir or _default_lease_dir()
+        self.node_id = node_id
+        self._node_bits = None if node_id is None else node_id << self.SEQUENCE_BITS
+        self._last = -1  # 上一个ID的 (时间戳 << SEQUENCE_BITS) | 序号
+        self._lock = Lock()
+        if node_id is None:
+            _leasing_generators.add(self)
+    
+    def _acquire_lease(self):
+        """租用一个未被其他进程占用的节点号"""
+        with self._lock:
+            if self._node_bits is not None:
+                return
+            os.makedirs(self.lease_dir, 0o700, exist_ok=True)
+            start = os.getpid()
+            for offset in range(self.MAX_NODE_ID + 1):
+                node_id = (start + offset) & self.MAX_NODE_ID
+                try:
+                    fd = os.open(os.path.join(self.lease_dir, f"node-{node_id}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+                except OSError:
+                    continue
+                if _try_lock_file(fd):
+                    self._lease = fd
+                    self.node_id = node_id
+                    self._node_bits = node_id << self.SEQUENCE_BITS
+                    return
+                os.close(fd)
+            raise RuntimeError(f"{self.lease_dir} 中的 {self.MAX_NODE_ID + 1} 个节点号都已被占用或无法访问")
+    
+    def _release_lease(self):
+        if self._lease is not None:
+            os.close(self._lease)
+            self._lease = None
+            self.node_id = None
+            self._node_bits = None
+    
+    def _after_fork(self):
+        # 父进程的锁可能在 fork 时正被其他线程持有；继承的租约属于父进程，关闭后在下次生成ID时重新租用
+        self._lock = Lock()
+        self._release_lease()
+    
+    def close(self):
+        """释放租用的节点号；之后再生成ID时重新租用"""
+        with self._lock:
+            self._release_lease()
+    
+    def __del__(self):
+        self._release_lease()
+    
+    def next_id(self):
+        """生成一个ID"""
+        if self._node_bits is None:
+            self._acquire_lease()
+        now = (self.clock() // 1_000_000 - self.EPOCH_MS) << self.SEQUENCE_BITS
+        with self._lock:
+            last = self._last = now if now > self._last else self._last + 1
+        return ((last >> self.SEQUENCE_BITS) << (self.NODE_BITS + self.SEQUENCE_BITS)
+                | self._node_bits | (last & self._SEQUENCE_MASK))
+    
+    def next_ids(self, count):
+        """一次生成 count 个连续的ID，只加锁一次"""
+        if self._node_bits is None:
+            self._acquire_lease()
+        now = (self.clock() // 1_000_000 - self.EPOCH_MS) << self.SEQUENCE_BITS
+        with self._lock:
+            first = now if now > self._last else self._last + 1
+            self._last = first + count - 1
+        shift = self.NODE_BITS + self.SEQUENCE_BITS
+        return [(value >> self.SEQUENCE_BITS) << shift | self._node_bits | (value & self._SEQUENCE_MASK)
+                for value in range(first, first + count)]
+    
+    @classmethod
+    def decompose(cls, value):
+        """拆分为 (Unix 毫秒时间戳, 节点号, 序号)"""
+        return ((value >> (cls.NODE_BITS + cls.SEQUENCE_BITS)) + cls.EPOCH_MS,
+                (value >> cls.SEQUENCE_BITS) & cls.MAX_NODE_ID,
+                value & cls._SEQUENCE_MASK)
+
+
+def _default_lease_dir():
+    """默认的节点租约目录，按用户区分，其他用户创建的目录和锁文件不会影响本用户"""
+    suffix = f"-{os.getuid()}" if hasattr(os, "getuid") else ""
+    return os.path.join(tempfile.gettempdir(), f"payment-id-nodes{suffix}")
+
+
+# 自动租用节点号的生成器，fork 后在子进程中逐个重置；只持有弱引用，不影响生成器回收
+_leasing_generators = weakref.WeakSet()
+
+
+def _reset_leases_after_fork():
+    for generator in list(_leasing_generators):
+        generator._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_leases_after_fork)
+
+
+def _try_lock_file(fd):
+    """对文件加非阻塞排他锁，已被其他进程锁定时返回 False"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def format_payment_id(prefix, value):
+    """格式化为 "前缀_16位十六进制" 形式，字符串顺序与数值顺序一致"""
+    return f"{prefix}_{value:016x}"
+
+
+def parse_payment_id(payment_id):
+    """解析 format_payment_id 生成的ID，返回 (前缀, 数值)"""
+    prefix, _, digits = payment_id.rpartition("_")
+    return prefix, int(digits, 16)
+
+
+class PaymentIdIndex:
+    """紧凑的支付ID索引 - 以有序的 64 位无符号整数数组保存，每个ID占 8 字节
+
+    同一生成器的ID递增，追加时通常只需放在末尾；to_bytes 输出小端字节序，可跨平台读取。
+    """
+    
+    __slots__ = ("_ids",)
+    
+    def __init__(self, ids=()):
+        self._ids = array("Q", sorted(ids))
+    
+    def add(self, value):
+        ids = self._ids
+        if not ids or value > ids[-1]:
+            ids.append(value)
+        else:
+            position = bisect_left(ids, value)
+            if position == len(ids) or ids[position] != value:
+                ids.insert(position, value)
+    
+    def __contains__(self, value):
+        position = bisect_left(self._ids, value)
+        return position < len(self._ids) and self._ids[position] == value
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def __iter__(self):
+        return iter(self._ids)
+    
+    def to_bytes(self):
+        if sys.byteorder == "little":
+            return self._ids.tobytes()
+        ids = array("Q", self._ids)
+        ids.byteswap()
+        return ids.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data):
+        index = cls()
+        index._ids.frombytes(data)
+        if sys.byteorder != "little":
+            index._ids.byteswap()
+        return index
+
+
+# 模拟网关使用的ID生成器
+_payment_ids = PaymentIdGenerator()
+
+
+# 网关日志 - 默认不输出，调用 configure_payment_logging 开启
+logger = logging.getLogger("payment.gateway")
+
+_CARD_TAG_PATTERN = re.compile(r"<(CardNumber|SecurityCode|Authentication)>([^<]*)</\1>")
+_CARD_NUMBER_KEYS = {"number", "card_number", "card_num"}
+_CVV_KEYS = {"cvv", "security_code"}
+
+
+def _mask_card_number(card_number):
+    """只保留卡号最后4位数字"""
+    card_number = str(card_number)
+    digits = sum(c.isdigit() for c in card_number)
+    masked, seen = [], 0
+    for c in card_number:
+        if c.isdigit():
+            seen += 1
+            masked.append(c if seen > digits - 4 else "*")
+        else:
+            masked.append(c)
+    return "".join(masked)
+
+
+def mask_card_data(payload):
+    """返回脱敏后的报文副本：卡号只保留最后4位，CVV 和认证信息完全隐藏；支持字典、列表和XML字符串"""
+    if isinstance(payload, str):
+        return _CARD_TAG_PATTERN.sub(
+            lambda m: f"<{m[1]}>{_mask_card_number(m[2]) if m[1] == 'CardNumber' else '***'}</{m[1]}>",
+            payload,
+        )
+    if isinstance(payload, dict):
+        masked = {}
+        for key, value in payload.items():
+            if key in _CARD_NUMBER_KEYS:
+                masked[key] = _mask_card_number(value)
+            elif key in _CVV_KEYS:
+                masked[key] = "***"
+            else:
+                masked[key] = mask_card_data(value)
+        return masked
+    if isinstance(payload, (list, tuple)):
+        return [mask_card_data(item) for item in payload]
+    return payload
+
+
+def _log_gateway_event(gateway, event, message, payload=None, **fields):
+    """记录结构化的网关事件：INFO 级别记录摘要，DEBUG 级别附带脱敏后的报文
+
+    调用方应先用 _gateway_log_enabled() 判断，日志关闭或未被采样时不构造任何消息。
+    """
+    extra = {"gateway": gateway, "event": event, "fields": fields, "payload": None}
+    if payload is not None and logger.isEnabledFor(logging.DEBUG):
+        extra["payload"] = mask_card_data(payload)
+        logger.debug("%s: %s %s", gateway, message, extra["payload"], extra=extra)
+    else:
+        logger.info("%s: %s", gateway, message, extra=extra)
+
+
+class SamplingFilter(logging.Filter):
+    """日志采样过滤器 - 按 rate 比例均匀放行日志，WARNING 及以上级别总是放行"""
+    
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+        # next() 在 GIL 下是原子的，多线程同时采样时每个事件仍然得到唯一的序号
+        self._sequence = count()
+    
+    def sample(self, level=logging.INFO):
+        if level >= logging.WARNING or self.rate >= 1.0:
+            return True
+        # 第 n 个事件在 n * rate 跨过整数时放行
+        n = next(self._sequence)
+        return int((n + 1) * self.rate) > int(n * self.rate)
+    
+    def filter(self, record):
+        return self.sample(record.levelno)
+
+
+# 网关事件的采样器，由 configure_payment_logging 设置
+_gateway_sampler = None
+# configure_payment_logging 安装的 (handler, QueueListener)，再次配置时先移除
+_gateway_logging = None
+
+
+def _gateway_log_enabled():
+    """网关是否需要记录本次事件；在构造日志记录之前完成级别判断和采样"""
+    return logger.isEnabledFor(logging.INFO) and (_gateway_sampler is None or _gateway_sampler.sample())
+
+
+def configure_payment_logging(level=logging.INFO, sample_rate=1.0, handler=None, use_queue=True):
+    """开启网关日志
+
+    网关事件在构造日志记录之前按 sample_rate 采样，再放入队列由后台线程写入 handler
+    （默认输出到标准错误），网关调用方不会因日志输出而阻塞。返回 QueueListener，
+    程序退出前调用其 stop() 以写完剩余日志；use_queue=False 时在调用线程中直接写入 handler，返回 None。
+    重复调用时替换上一次安装的 handler，并停止上一次启动的 QueueListener。
+    """
+    global _gateway_sampler, _gateway_logging
+    if _gateway_logging is not None:
+        previous_handler, previous_listener = _gateway_logging
+        logger.removeHandler(previous_handler)
+        # 调用方可能已经自行 stop() 过
+        if previous_listener is not None and previous_listener._thread is not None:
+            previous_listener.stop()
+        _gateway_logging = None
+    _gateway_sampler = SamplingFilter(sample_rate) if sample_rate < 1.0 else None
+    handler = handler or logging.StreamHandler()
+    listener = None
+    if use_queue:
+        queue = SimpleQueue()
+        listener = QueueListener(queue, handler, respect_handler_level=True)
+        listener.start()
+        handler = QueueHandler(queue)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    _gateway_logging = (handler, listener)
+    return listener
+
+
+# 传输层 - 网关与支付端点之间的HTTP通信
+class GatewayHTTPError(Exception):
+    """支付端点返回了非 2xx 状态码"""
+    
+    def __init__(self, status, body):
+        super().__init__(f"支付端点返回 HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+class RequestNotSentError(Exception):
+    """请求没有发出 - 在发送之前失败（如等待连接超时、没有可用网关、请求无法编码），可以安全地重试"""
+
+
+class Transport(ABC):
+    """传输层接口 - 发送HTTP请求并返回 (状态码, 响应体字节)"""
+    
+    @abstractmethod
+    def request(self, method, url, body=b"", headers=None):
+        """发送一个请求"""
+        pass
+    
+    def request_many(self, requests):
+        """发送多个 (method, url, body, headers) 请求，按请求顺序返回结果列表"""
+        return [self.request(*request) for request in requests]
+    
+    def close(self):
+        """释放传输层持有的连接"""
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _split_url(url):
+    """拆分为 ((scheme, host, port), 请求路径)"""
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return (parts.scheme, parts.hostname, parts.port), path
+
+
+def _open_connection(origin, timeout):
+    scheme, host, port = origin
+    connection_class = HTTPSConnection if scheme == "https" else HTTPConnection
+    return connection_class(host, port, timeout=timeout)
+
+
+def _connection_dropped(connection):
+    """空闲的 keep-alive 连接可读说明服务端已关闭连接（或发来了意外的数据），不能再复用"""
+    if connection.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class SimpleHttpTransport(Transport):
+    """不复用连接的传输层 - 每个请求新建一个TCP连接，响应后关闭"""
+    
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        self.connections_opened = 0
+    
+    def request(self, method, url, body=b"", headers=None):
+        origin, path = _split_url(url)
+        connection = _open_connection(origin, self.timeout)
+        self.connections_opened += 1
+        try:
+            connection.request(method, path, body, {**(headers or {}), "Connection": "close"})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+
+class _HostPool:
+    """单个主机的连接池 - 空闲连接后进先出，slots 限制同时使用的连接数"""
+    
+    __slots__ = ("idle", "slots")
+    
+    def __init__(self, size):
+        self.idle = deque()
+        self.slots = BoundedSemaphore(size)
+
+
+class PooledHttpTransport(Transport):
+    """带 keep-alive 连接池的传输层
+
+    每个主机最多同时使用 pool_size 个连接（pool_sizes 可按 "host:port" 单独配置），
+    请求完成后连接放回池中供后续请求复用；连接池已满时最多等待 pool_timeout 秒，超时抛出 RequestNotSentError。
+    timeout 为建立连接和读取响应的超时（秒）。
+
+    http.client 不支持 HTTP/1.1 管线化，request_many 改为把多个请求
+    分发到池中的多个长连接上并发发送，同样省去了逐个等待往返的时间。
+    """
+    
+    # 复用的连接可能已被服务端关闭。发送时出现 BrokenPipeError 说明请求没有送达，可以换新连接重发；
+    # 发送成功后才断开时服务端可能已经处理了请求，只有幂等方法才重发，支付等 POST 请求直接报错
+    _STALE_CONNECTION_ERRORS = (RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+    _IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+    
+    def __init__(self, pool_size=10, timeout=10.0, pool_timeout=None, pool_sizes=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pool_timeout = timeout if pool_timeout is None else pool_timeout
+        self.pool_sizes = pool_sizes or {}
+        self.connections_opened = 0
+        self._pools = {}
+        self._lock = Lock()
+    
+    def _pool(self, origin):
+        pool = self._pools.get(origin)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(origin)
+                if pool is None:
+                    size = self.pool_sizes.get(f"{origin[1]}:{origin[2]}", self.pool_size)
+                    pool = self._pools[origin] = _HostPool(size)
+        return pool
+    
+    def _checkout(self, pool, origin):
+        """取出一个空闲连接，没有时新建，返回 (连接, 是否复用)；已被服务端关闭的空闲连接直接丢弃"""
+        while True:
+            try:
+                connection = pool.idle.pop()
+            except IndexError:
+                break
+            if not _connection_dropped(connection):
+                return connection, True
+            connection.close()
+        with self._lock:
+            self.connections_opened += 1
+        return _open_connection(origin, self.timeout), False
+    
+    def request(self, method, url, body=b"", headers=None):
+        origin, path = _split_url(url)
+        pool = self._pool(origin)
+        if not pool.slots.acquire(timeout=self.pool_timeout):
+            raise RequestNotSentError(f"等待 {origin[1]}:{origin[2]} 的空闲连接超时")
+        try:
+            connection, reused = self._checkout(pool, origin)
+            retry_after_send = method in self._IDEMPOTENT_METHODS
+            while True:
+                sent = False
+                try:
+                    connection.request(method, path, body, headers or {})
+                    sent = True
+                    response = connection.getresponse()
+                    data = response.read()
+                    break
+                except self._STALE_CONNECTION_ERRORS as error:
+                    connection.close()
+                    if not reused or not (retry_after_send or (not sent and isinstance(error, BrokenPipeError))):
+                        raise
+                    connection, reused = self._checkout(pool, origin)
+                except BaseException:
+                    connection.close()
+                    raise
+            if response.will_close:
+                connection.close()
+            else:
+                pool.idle.append(connection)
+            return response.status, data
+        finally:
+            pool.slots.release()
+    
+    def request_many(self, requests):
+        return list(_bounded_map(lambda request: self.request(*request), requests, self.pool_size))
+    
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while pool.idle:
+                pool.idle.pop().close()
+
+
+def _post(transport, url, body, headers):
+    """通过传输层发送 POST 请求，返回响应体字节"""
+    status, data = transport.request("POST", url, body, headers)
+    if not 200 <= status < 300:
+        raise GatewayHTTPError(status, data)
+    return data
+
+
+# JSON请求模板 - 预先编码请求中不变的部分
+class JsonField:
+    """JSON请求模板中的可变字段占位符"""
+    
+    __slots__ = ("name",)
+    
+    def __init__(self, name):
+        self.name = name
+
+
+class JsonRequestTemplate:
+    """预编码的JSON请求模板
+
+    template 为嵌套的字典 / 列表，可变字段用 JsonField 占位。键名、分隔符和常量值
+    在创建时编码为字节，render 只编码可变字段并一次性拼入结果，
+    输出与 json.dumps(完整字典).encode() 逐字节相同，可直接写入套接字。
+    """
+    
+    def __init__(self, template):
+        self.fields = []
+        # json.dumps 会把常量中的 NUL 转义为 \u0000，编码结果中的 NUL 只来自字段占位
+        parts = self._compile(template).encode().replace(b"%", b"%%").split(b"\0")
+        self._format = b"%b".join(parts)
+    
+    def _compile(self, value):
+        if isinstance(value, JsonField):
+            self.fields.append(value.name)
+            return "\0"
+        if isinstance(value, dict):
+            return "{" + ", ".join(f"{json.dumps(key)}: {self._compile(item)}" for key, item in value.items()) + "}"
+        if isinstance(value, (list, tuple)):
+            return "[" + ", ".join(self._compile(item) for item in value) + "]"
+        return json.dumps(value)
+    
+    def render(self, *values):
+        """按字段在模板中出现的顺序传入可变字段的值，返回请求体字节"""
+        return self._format % tuple(map(_encode_json_value, values))
+
+
+def _encode_json_value(value):
+    """按 json.dumps 的默认规则编码单个值"""
+    value_type = type(value)
+    if value_type is str:
+        return encode_basestring_ascii(value).encode()
+    if value_type is int:
+        return int.__repr__(value).encode()
+    if value_type is float and value == value and value not in (_INFINITY, -_INFINITY):
+        return float.__repr__(value).encode()
+    return json.dumps(value).encode()
+
+
+_INFINITY = float("inf")
 
 
 # 被适配者 - 现有的JSON格式支付网关
 class JsonPaymentGateway:
-    """JSON格式支付网关 - 被适配者"""
+    """JSON格式支付网关 - 被适配者
+
+    传入 transport 和 endpoint（如 "http://127.0.0.1:8080"）时通过HTTP调用支付端点，
+    否则在本地模拟响应。
+    """
     
-    def __init__(self, merchant_id, api_key):
+    def __init__(self, merchant_id, api_key, transport=None, endpoint=None):
         self.merchant_id = merchant_id
         self.api_key = api_key
+        self.transport = transport
+        self.endpoint = endpoint
+        self._headers = {"Content-Type": "application/json", "X-Merchant-ID": str(merchant_id),
+                         "X-API-Key": str(api_key)}
+    
+    def _post_json(self, path, data):
+        try:
+            body = json.dumps(data).encode()
+        except (TypeError, ValueError) as error:
+            raise RequestNotSentError(f"请求无法编码为JSON: {error}") from error
+        return json.loads(_post(self.transport, self.endpoint + path, body, self._headers))
     
     def submit_payment_json(self, payment_data):
         """提交支付数据 (JSON格式)"""
-        # 这里模拟发送数据到支付网关
-        print(f"JsonPaymentGateway: 发送支付请求，商户ID: {self.merchant_id}")
-        print(f"支付数据: {payment_data}")
+        if _gateway_log_enabled():
+            _log_gateway_event("JsonPaymentGateway", "payment_request",
+                               f"发送支付请求，商户ID: {self.merchant_id}", payment_data,
+                               merchant_id=self.merchant_id)
         
+        if self.transport is not None:
+            return self._post_json("/json/payments", payment_data)
         # 模拟成功响应
-        response = {
-            "status": "success",
-            "payment_id": "json_" + str(hash(payment_data["card"]["number"]))[1:8],
-            "transaction_time": "2023-10-01T12:30:45Z"
-        }
-        return response
+        return self._simulate_payment(payment_data)
+    
+    def _submit_payment_encoded(self, body):
+        """通过 transport 提交已编码为JSON字节的支付数据，与 submit_payment_json 相同但省去编码
+
+        只供 JsonPaymentAdapter 在 submit_payment_json 未被子类重写时使用。
+        """
+        if _gateway_log_enabled():
+            payload = json.loads(body) if logger.isEnabledFor(logging.DEBUG) else None
+            _log_gateway_event("JsonPaymentGateway", "payment_request",
+                               f"发送支付请求，商户ID: {self.merchant_id}", payload,
+                               merchant_id=self.merchant_id)
+        return json.loads(_post(self.transport, self.endpoint + "/json/payments", body, self._headers))
     
     def request_refund_json(self, refund_data):
         """请求退款 (JSON格式)"""
-        print(f"JsonPaymentGateway: 发送退款请求，商户ID: {self.merchant_id}")
-        print(f"退款数据: {refund_data}")
+        if _gateway_log_enabled():
+            _log_gateway_event("JsonPaymentGateway", "refund_request",
+                               f"发送退款请求，商户ID: {self.merchant_id}", refund_data,
+                               merchant_id=self.merchant_id, payment_id=refund_data["payment_id"])
         
+        if self.transport is not None:
+            return self._post_json("/json/refunds", refund_data)
         # 模拟成功响应
-        response = {
-            "status": "success",
-            "refund_id": "ref_" + refund_data["payment_id"][4:],
-            "refund_time": "2023-10-02T10:15:30Z"
-        }
-        return response
+        return self._simulate_refund(refund_data)
     
     def check_status_json(self, payment_id):
         """查询支付状态 (JSON格式)"""
-        print(f"JsonPaymentGateway: 查询支付状态，ID: {payment_id}")
+        if _gateway_log_enabled():
+            _log_gateway_event("JsonPaymentGateway", "status_request",
+                               f"查询支付状态，ID: {payment_id}", payment_id=payment_id)
         
+        if self.transport is not None:
+            return self._post_json("/json/status", {"payment_id": payment_id})
         # 模拟状态响应
-        response = {
+        return self._simulate_status(payment_id)
+    
+    def submit_payments_json(self, payment_data_list):
+        """批量提交支付数据 (JSON数组)，按请求顺序返回结果"""
+        if _gateway_log_enabled():
+            _log_gateway_event("JsonPaymentGateway", "payment_batch_request",
+                               f"发送批量支付请求，商户ID: {self.merchant_id}，共 {len(payment_data_list)} 笔",
+                               merchant_id=self.merchant_id, count=len(payment_data_list))
+        
+        if self.transport is not None:
+            return self._post_json("/json/payments/batch", payment_data_list)
+        # 模拟成功响应
+        return [self._simulate_payment(payment_data) for payment_data in payment_data_list]
+    
+    def check_statuses_json(self, payment_ids):
+        """批量查询支付状态 (JSON数组)"""
+        if _gateway_log_enabled():
+            _log_gateway_event("JsonPaymentGateway", "status_batch_request",
+                               f"批量查询支付状态，共 {len(payment_ids)} 个", count=len(payment_ids))
+        
+        if self.transport is not None:
+            return self._post_json("/json/status/batch", list(payment_ids))
+        # 模拟状态响应
+        return [self._simulate_status(payment_id) for payment_id in payment_ids]
+    
+    @staticmethod
+    def _simulate_payment(payment_data):
+        return {
+            "status": "success",
+            "payment_id": format_payment_id("json", _payment_ids.next_id()),
+            "transaction_time": "2023-10-01T12:30:45Z"
+        }
+    
+    @staticmethod
+    def _simulate_refund(refund_data):
+        return {
+            "status": "success",
+            "refund_id": format_payment_id("ref", _payment_ids.next_id()),
+            "refund_time": "2023-10-02T10:15:30Z"
+        }
+    
+    @staticmethod
+    def _simulate_status(payment_id):
+        return {
             "payment_id": payment_id,
             "status": "completed",
             "amount": "###.##",  # 实际中会有真实金额
             "processed_at": "2023-10-01T12:30:45Z"
         }
-        return response
+
+
+# XML报文编解码器
+class XmlPaymentCodec:
+    """XML支付报文编解码器
+
+    请求报文由预先编译的紧凑模板生成，商户代码和认证信息在创建时写入模板；
+    解析响应时只提取需要的标签，不构建元素树：不含实体、注释和 CDATA 的简单报文
+    直接按标签扫描，其余报文和大批量响应用 expat 流式解析。
+    """
+    
+    PAYMENT_FIELDS = {"Status": "status", "PaymentID": "payment_id", "TransactionTime": "transaction_time"}
+    REFUND_FIELDS = {"Status": "status", "RefundID": "refund_id", "RefundTime": "refund_time"}
+    STATUS_FIELDS = {"PaymentID": "payment_id", "Status": "status", "Amount": "amount", "ProcessedAt": "processed_at"}
+    
+    _CARD_TEMPLATE = (
+        "<CardDetails><CardNumber>%s</CardNumber><ExpiryDate>%s</ExpiryDate>"
+        "<SecurityCode>%s</SecurityCode></CardDetails>"
+        "<TransactionDetails><Amount>%s</Amount><Currency>CNY</Currency></TransactionDetails>"
+    )
+    
+    def __init__(self, merchant_code, api_key):
+        self._header = (f"<MerchantCode>{escape(str(merchant_code))}</MerchantCode>"
+                        f"<Authentication>{escape(str(api_key))}</Authentication>")
+        # 模板中的 % 只来自占位符，商户信息里的 % 需要转义
+        header = self._header.replace("%", "%%")
+        self._payment_template = f"<PaymentRequest>{header}{self._CARD_TEMPLATE}</PaymentRequest>"
+        # 支付请求的常量片段（开头、卡号后、有效期后、安全码后、结尾），字段无需转义时直接拼接
+        prefix, *middle, suffix = self._CARD_TEMPLATE.split("%s")
+        self._payment_parts = (f"<PaymentRequest>{self._header}{prefix}", *middle, f"{suffix}</PaymentRequest>")
+        self._refund_template = f"<RefundRequest>{header}<PaymentID>%s</PaymentID>%s</RefundRequest>"
+        self._status_template = f"<StatusRequest>{header}<PaymentID>%s</PaymentID></StatusRequest>"
+    
+    def encode_payment_request(self, card_num, exp_date, security_code, amount):
+        # 常见情况：卡片字段不含特殊字符、金额为数字，一次检查后用 f-string 拼接，不逐个字段转换
+        fields = f"{card_num}{exp_date}{security_code}"
+        if "&" in fields or "<" in fields or ">" in fields or type(amount) not in _XML_NUMBERS:
+            return self._payment_template % (
+                _xml_text(card_num), _xml_text(exp_date), _xml_text(security_code), _xml_text(amount)
+            )
+        prefix, after_card, after_expiry, after_code, suffix = self._payment_parts
+        return f"{prefix}{card_num}{after_card}{exp_date}{after_expiry}{security_code}{after_code}{amount}{suffix}"
+    
+    def encode_refund_request(self, payment_id, refund_amount=None):
+        if refund_amount:
+            amount = f"<Amount>{_xml_text(refund_amount)}</Amount>"
+        else:
+            amount = "<FullRefund>true</FullRefund>"
+        return self._refund_template % (_xml_text(payment_id), amount)
+    
+    def encode_status_request(self, payment_id):
+        return self._status_template % _xml_text(payment_id)
+    
+    def encode_payment_batch_request(self, payments):
+        """payments 为 (卡号, 有效期, 安全码, 金额) 序列"""
+        card_template = "<PaymentRequest>" + self._CARD_TEMPLATE + "</PaymentRequest>"
+        parts = ["<PaymentBatchRequest>", self._header]
+        for card_num, exp_date, security_code, amount in payments:
+            parts.append(card_template % (
+                _xml_text(card_num), _xml_text(exp_date), _xml_text(security_code), _xml_text(amount)
+            ))
+        parts.append("</PaymentBatchRequest>")
+        return "".join(parts)
+    
+    def encode_status_batch_request(self, payment_ids):
+        parts = ["<StatusBatchRequest>", self._header]
+        for payment_id in payment_ids:
+            parts.append(f"<StatusRequest><PaymentID>{_xml_text(payment_id)}</PaymentID></StatusRequest>")
+        parts.append("</StatusBatchRequest>")
+        return "".join(parts)
+    
+    @staticmethod
+    def decode(xml_response, fields):
+        """解析单个响应报文，fields 为 {标签名: 结果键名}，返回只含这些键的字典
+
+        只读取根元素的直接子元素，同名标签取第一个，与 ElementTree 的 root.find() 一致。
+        """
+        if "&" not in xml_response and "<!" not in xml_response:
+            matches = _field_pattern(tuple(fields)).findall(xml_response)
+            # 正则不区分层级，每个标签恰好出现一次时才能确定匹配到的是根元素的子元素
+            if len(matches) == len(fields):
+                response = {fields[tag]: text for tag, text in matches}
+                if len(response) == len(fields):
+                    return response
+        reader = _XmlFieldReader(fields, None)
+        parser = reader.create_parser()
+        parser.Parse(xml_response, True)
+        return reader.current
+    
+    @staticmethod
+    def iter_decode(chunks, record_tag, fields):
+        """流式解析批量响应，每遇到一个 record_tag 元素产出一条记录
+
+        chunks 为字符串或字节片段的可迭代对象，解析过程不构建元素树，
+        内存占用只与片段大小有关。
+        """
+        reader = _XmlFieldReader(fields, record_tag)
+        parser = reader.create_parser()
+        for chunk in chunks:
+            parser.Parse(chunk, False)
+            if reader.records:
+                yield from reader.records
+                reader.records.clear()
+        parser.Parse(b"", True)
+        yield from reader.records
+
+
+_XML_NUMBERS = (int, float)
+
+
+def _xml_text(value):
+    """转换为可以直接写入XML的文本，只在含有特殊字符时转义"""
+    if type(value) is str:
+        if "&" in value or "<" in value or ">" in value:
+            return escape(value)
+        return value
+    if type(value) in _XML_NUMBERS:
+        return value
+    return escape(str(value))
+
+
+@lru_cache(maxsize=None)
+def _field_pattern(tags):
+    """匹配 <标签>文本</标签> 形式的叶子元素"""
+    return re.compile("<(%s)>([^<]*)</\\1>" % "|".join(map(re.escape, tags)))
+
+
+class _XmlFieldReader:
+    """expat 回调 - 收集指定标签的文本
+
+    只收集记录元素（record_tag 为 None 时为根元素）的直接子元素，同名标签取第一个。
+    """
+    
+    __slots__ = ("fields", "record_tag", "current", "records", "key", "depth", "field_depth")
+    
+    def __init__(self, fields, record_tag):
+        self.fields = fields
+        self.record_tag = record_tag
+        self.current = {}
+        self.records = []
+        self.key = None
+        self.depth = 0
+        self.field_depth = 2 if record_tag is None else None
+    
+    def create_parser(self):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.data
+        return parser
+    
+    def start(self, name, attributes):
+        self.depth = depth = self.depth + 1
+        if depth == self.field_depth:
+            key = self.fields.get(name)
+            if key is not None and key not in self.current:
+                self.current[key] = ""
+                self.key = key
+                return
+        elif name == self.record_tag and self.field_depth is None:
+            self.field_depth = depth + 1
+        self.key = None
+    
+    def data(self, text):
+        if self.key is not None:
+            self.current[self.key] += text
+    
+    def end(self, name):
+        self.key = None
+        self.depth -= 1
+        if name == self.record_tag and self.depth + 2 == self.field_depth:
+            self.records.append(self.current)
+            self.current = {}
+            self.field_depth = None
 
 
 # 被适配者 - 现有的XML格式支付网关
 class XmlPaymentGateway:
-    """XML格式支付网关 - 被适配者"""
+    """XML格式支付网关 - 被适配者
+
+    传入 transport 和 endpoint 时通过HTTP调用支付端点，否则在本地模拟响应。
+    """
     
-    def __init__(self, api_key, merchant_code):
+    # 模拟的网关响应报文
+    _PAYMENT_RESPONSE = (
+        "<PaymentResponse><Status>Success</Status><PaymentID>%s</PaymentID>"
+        "<TransactionTime>2023-10-01T12:45:30Z</TransactionTime></PaymentResponse>"
+    )
+    _REFUND_RESPONSE = (
+        "<RefundResponse><Status>Success</Status><RefundID>%s</RefundID>"
+        "<RefundTime>2023-10-02T15:20:10Z</RefundTime></RefundResponse>"
+    )
+    _STATUS_RESPONSE = (
+        "<StatusResponse><PaymentID>%s</PaymentID><Status>Completed</Status>"
+        "<Amount>###.##</Amount><ProcessedAt>2023-10-01T12:45:30Z</ProcessedAt></StatusResponse>"
+    )
+    
+    _HEADERS = {"Content-Type": "application/xml; charset=utf-8"}
+    
+    def __init__(self, api_key, merchant_code, transport=None, endpoint=None):
         self.api_key = api_key
         self.merchant_code = merchant_code
+        self.codec = XmlPaymentCodec(merchant_code, api_key)
+        self.transport = transport
+        self.endpoint = endpoint
+    
+    def _post_xml(self, path, xml_request):
+        return _post(self.transport, self.endpoint + path, xml_request.encode(), self._HEADERS).decode()
     
     def send_payment_request(self, card_num, exp_date, security_code, amount):
         """发送支付请求 (XML格式)"""
         # 构建XML请求
-        xml_request = f"""
-        <PaymentRequest>
-            <MerchantCode>{self.merchant_code}</MerchantCode>
-            <Authentication>{self.api_key}</Authentication>
-            <CardDetails>
-                <CardNumber>{card_num}</CardNumber>
-                <ExpiryDate>{exp_date}</ExpiryDate>
-                <SecurityCode>{security_code}</SecurityCode>
-            </CardDetails>
-            <TransactionDetails>
-                <Amount>{amount}</Amount>
-                <Currency>CNY</Currency>
-            </TransactionDetails>
-        </PaymentRequest>
-        """
+        xml_request = self.codec.encode_payment_request(card_num, exp_date, security_code, amount)
         
-        print(f"XmlPaymentGateway: 发送支付请求，商户代码: {self.merchant_code}")
-        print(f"XML请求: {xml_request}")
+        if _gateway_log_enabled():
+            _log_gateway_event("XmlPaymentGateway", "payment_request",
+                               f"发送支付请求，商户代码: {self.merchant_code}", xml_request,
+                               merchant_code=self.merchant_code)
         
-        # 模拟XML响应
-        xml_response = f"""
-        <PaymentResponse>
-            <Status>Success</Status>
-            <PaymentID>xml_{str(hash(card_num))[1:8]}</PaymentID>
-            <TransactionTime>2023-10-01T12:45:30Z</TransactionTime>
-        </PaymentResponse>
-        """
+        if self.transport is not None:
+            xml_response = self._post_xml("/xml/payments", xml_request)
+        else:
+            # 模拟XML响应
+            xml_response = self._simulate_payment(card_num)
         
         # 解析XML响应
-        root = ET.fromstring(xml_response)
-        response = {
-            "status": root.find("Status").text.lower(),
-            "payment_id": root.find("PaymentID").text,
-            "transaction_time": root.find("TransactionTime").text
-        }
-        
+        response = self.codec.decode(xml_response, XmlPaymentCodec.PAYMENT_FIELDS)
+        response["status"] = response["status"].lower()
         return response
     
     def process_refund(self, payment_id, refund_amount=None):
         """处理退款请求 (XML格式)"""
         # 构建XML请求
-        xml_request = f"""
-        <RefundRequest>
-            <MerchantCode>{self.merchant_code}</MerchantCode>
-            <Authentication>{self.api_key}</Authentication>
-            <PaymentID>{payment_id}</PaymentID>
-            {"<Amount>" + str(refund_amount) + "</Amount>" if refund_amount else "<FullRefund>true</FullRefund>"}
-        </RefundRequest>
-        """
+        xml_request = self.codec.encode_refund_request(payment_id, refund_amount)
         
-        print(f"XmlPaymentGateway: 发送退款请求，支付ID: {payment_id}")
-        print(f"XML请求: {xml_request}")
+        if _gateway_log_enabled():
+            _log_gateway_event("XmlPaymentGateway", "refund_request",
+                               f"发送退款请求，支付ID: {payment_id}", xml_request,
+                               merchant_code=self.merchant_code, payment_id=payment_id)
         
-        # 模拟XML响应
-        xml_response = f"""
-        <RefundResponse>
-            <Status>Success</Status>
-            <RefundID>ref_{payment_id[4:]}</RefundID>
-            <RefundTime>2023-10-02T15:20:10Z</RefundTime>
-        </RefundResponse>
-        """
+        if self.transport is not None:
+            xml_response = self._post_xml("/xml/refunds", xml_request)
+        else:
+            # 模拟XML响应
+            xml_response = self._simulate_refund(payment_id)
         
         # 解析XML响应
-        root = ET.fromstring(xml_response)
-        response = {
-            "status": root.find("Status").text.lower(),
-            "refund_id": root.find("RefundID").text,
-            "refund_time": root.find("RefundTime").text
-        }
-        
+        response = self.codec.decode(xml_response, XmlPaymentCodec.REFUND_FIELDS)
+        response["status"] = response["status"].lower()
         return response
     
     def get_payment_info(self, payment_id):
         """获取支付信息 (XML格式)"""
         # 构建XML请求
-        xml_request = f"""
-        <StatusRequest>
-            <MerchantCode>{self.merchant_code}</MerchantCode>
-            <Authentication>{self.api_key}</Authentication>
-            <PaymentID>{payment_id}</PaymentID>
-        </StatusRequest>
-        """
+        xml_request = self.codec.encode_status_request(payment_id)
         
-        print(f"XmlPaymentGateway: 查询支付状态，ID: {payment_id}")
-        print(f"XML请求: {xml_request}")
+        if _gateway_log_enabled():
+            _log_gateway_event("XmlPaymentGateway", "status_request",
+                               f"查询支付状态，ID: {payment_id}", xml_request,
+                               merchant_code=self.merchant_code, payment_id=payment_id)
         
-        # 模拟XML响应
-        xml_response = f"""
-        <StatusResponse>
-            <PaymentID>{payment_id}</PaymentID>
-            <Status>Completed</Status>
-            <Amount>###.##</Amount>
-            <ProcessedAt>2023-10-01T12:45:30Z</ProcessedAt>
-        </StatusResponse>
-        """
+        if self.transport is not None:
+            xml_response = self._post_xml("/xml/status", xml_request)
+        else:
+            # 模拟XML响应
+            xml_response = self._simulate_status(payment_id)
         
         # 解析XML响应
-        root = ET.fromstring(xml_response)
-        response = {
-            "payment_id": root.find("PaymentID").text,
-            "status": root.find("Status").text.lower(),
-            "amount": root.find("Amount").text,
-            "processed_at": root.find("ProcessedAt").text
-        }
-        
+        response = self.codec.decode(xml_response, XmlPaymentCodec.STATUS_FIELDS)
+        response["status"] = response["status"].lower()
         return response
+    
+    def send_payment_requests(self, payments):
+        """批量发送支付请求 (一个XML文档包含多个 PaymentRequest)，按请求顺序返回结果
+
+        payments 为 (卡号, 有效期, 安全码, 金额) 序列。
+        """
+        xml_request = self.codec.encode_payment_batch_request(payments)
+        
+        if _gateway_log_enabled():
+            _log_gateway_event("XmlPaymentGateway", "payment_batch_request",
+                               f"发送批量支付请求，商户代码: {self.merchant_code}，共 {len(payments)} 笔",
+                               merchant_code=self.merchant_code, count=len(payments))
+        
+        if self.transport is not None:
+            xml_response = (self._post_xml("/xml/payments/batch", xml_request),)
+        else:
+            # 模拟XML响应，逐条生成片段
+            xml_response = self._batch_response(
+                "PaymentBatchResponse", (self._simulate_payment(card_num) for card_num, *_ in payments)
+            )
+        
+        # 流式解析XML响应
+        responses = []
+        for response in self.codec.iter_decode(xml_response, "PaymentResponse", XmlPaymentCodec.PAYMENT_FIELDS):
+            response["status"] = response["status"].lower()
+            responses.append(response)
+        return responses
+    
+    def get_payments_info(self, payment_ids):
+        """批量获取支付信息 (一个XML文档包含多个 StatusRequest)"""
+        xml_request = self.codec.encode_status_batch_request(payment_ids)
+        
+        if _gateway_log_enabled():
+            _log_gateway_event("XmlPaymentGateway", "status_batch_request",
+                               f"批量查询支付状态，共 {len(payment_ids)} 个",
+                               merchant_code=self.merchant_code, count=len(payment_ids))
+        
+        if self.transport is not None:
+            xml_response = (self._post_xml("/xml/status/batch", xml_request),)
+        else:
+            # 模拟XML响应，逐条生成片段
+            xml_response = self._batch_response(
+                "StatusBatchResponse", (self._simulate_status(payment_id) for payment_id in payment_ids)
+            )
+        
+        # 流式解析XML响应
+        responses = []
+        for response in self.codec.iter_decode(xml_response, "StatusResponse", XmlPaymentCodec.STATUS_FIELDS):
+            response["status"] = response["status"].lower()
+            responses.append(response)
+        return responses
+    
+    @classmethod
+    def _simulate_payment(cls, card_num):
+        return cls._PAYMENT_RESPONSE % format_payment_id("xml", _payment_ids.next_id())
+    
+    @classmethod
+    def _simulate_refund(cls, payment_id):
+        return cls._REFUND_RESPONSE % format_payment_id("ref", _payment_ids.next_id())
+    
+    @classmethod
+    def _simulate_status(cls, payment_id):
+        return cls._STATUS_RESPONSE % escape(str(payment_id))
+    
+    @staticmethod
+    def _batch_response(root_tag, records):
+        yield f"<{root_tag}>"
+        yield from records
+        yield f"</{root_tag}>"
+
+
+# 桩服务 - 在本地进程中模拟支付端点
+def _stub_json(handler):
+    def route(body):
+        return "application/json", json.dumps(handler(json.loads(body))).encode()
+    return route
+
+
+def _stub_xml(handler, fields, record_tag=None, root_tag=None):
+    def route(body):
+        if record_tag is None:
+            xml_response = handler(**XmlPaymentCodec.decode(body.decode(), fields))
+        else:
+            records = XmlPaymentCodec.iter_decode((body,), record_tag, fields)
+            xml_response = "".join(XmlPaymentGateway._batch_response(
+                root_tag, (handler(**record) for record in records)
+            ))
+        return "application/xml; charset=utf-8", xml_response.encode()
+    return route
+
+
+_STUB_ROUTES = {
+    "/json/payments": _stub_json(JsonPaymentGateway._simulate_payment),
+    "/json/refunds": _stub_json(JsonPaymentGateway._simulate_refund),
+    "/json/status": _stub_json(lambda request: JsonPaymentGateway._simulate_status(request["payment_id"])),
+    "/json/payments/batch": _stub_json(lambda requests: [JsonPaymentGateway._simulate_payment(request)
+                                                         for request in requests]),
+    "/json/status/batch": _stub_json(lambda payment_ids: [JsonPaymentGateway._simulate_status(payment_id)
+                                                          for payment_id in payment_ids]),
+    "/xml/payments": _stub_xml(XmlPaymentGateway._simulate_payment, {"CardNumber": "card_num"}),
+    "/xml/refunds": _stub_xml(XmlPaymentGateway._simulate_refund, {"PaymentID": "payment_id"}),
+    "/xml/status": _stub_xml(XmlPaymentGateway._simulate_status, {"PaymentID": "payment_id"}),
+    "/xml/payments/batch": _stub_xml(XmlPaymentGateway._simulate_payment, {"CardNumber": "card_num"},
+                                     "PaymentRequest", "PaymentBatchResponse"),
+    "/xml/status/batch": _stub_xml(XmlPaymentGateway._simulate_status, {"PaymentID": "payment_id"},
+                                   "StatusRequest", "StatusBatchResponse"),
+}
+
+
+class _StubGatewayHandler(BaseHTTPRequestHandler):
+    """桩服务的请求处理器 - HTTP/1.1，默认保持连接"""
+    
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭 Nagle 算法避免与客户端的延迟确认相互等待
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        route = _STUB_ROUTES.get(self.path)
+        if route is None:
+            self.send_error(404)
+            return
+        content_type, payload = route(body)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        # 不输出访问日志
+        pass
+
+
+class StubPaymentServer:
+    """进程内的支付端点桩服务 - 在后台线程中运行，返回与本地模拟相同的响应
+
+    用于在测试和性能测试中验证传输层，endpoint 可直接传给网关。
+    """
+    
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), _StubGatewayHandler)
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
 
 
 # 适配器 - 将JSON支付网关适配到目标接口
 class JsonPaymentAdapter(PaymentProcessor):
     """JSON支付网关适配器 - 适配器"""
     
-    def __init__(self, json_gateway):
+    # 与 build_payment_data 结构相同的预编码模板
+    PAYMENT_TEMPLATE = JsonRequestTemplate({
+        "card": {
+            "number": JsonField("card_number"),
+            "expiry": JsonField("expiry_date"),
+            "cvv": JsonField("cvv")
+        },
+        "transaction": {
+            "amount": JsonField("amount"),
+            "currency": "CNY"
+        }
+    })
+    
+    def __init__(self, json_gateway, batch_size=1000):
         self.json_gateway = json_gateway
+        self.batch_size = batch_size
     
-    def process_payment(self, amount, card_number, expiry_date, cvv):
-        """适配JSON网关的支付方法"""
-        # 转换数据格式
-        payment_data = {
+    @staticmethod
+    def build_payment_data(amount, card_number, expiry_date, cvv):
+        """将目标接口的参数转换为JSON网关的支付数据"""
+        return {
             "card": {
                 "number": card_number,
                 "expiry": expiry_date,
@@ -252,12 +1489,10 @@ class JsonPaymentAdapter(PaymentProcessor):
                 "currency": "CNY"
             }
         }
-        
-        # 调用JSON网关的方法
-        return self.json_gateway.submit_payment_json(payment_data)
     
-    def refund_payment(self, payment_id, amount=None):
-        """适配JSON网关的退款方法"""
+    @staticmethod
+    def build_refund_data(payment_id, amount=None):
+        """将目标接口的参数转换为JSON网关的退款数据"""
         refund_data = {
             "payment_id": payment_id,
             "full_refund": amount is None
@@ -266,19 +1501,64 @@ class JsonPaymentAdapter(PaymentProcessor):
         if amount:
             refund_data["amount"] = amount
         
-        return self.json_gateway.request_refund_json(refund_data)
+        return refund_data
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        """适配JSON网关的支付方法"""
+        # 通过HTTP发送且 submit_payment_json 未被重写时，用预编码模板生成请求体，不构建字典；
+        # 模板无法编码的值（如 Decimal）仍交给 submit_payment_json 处理
+        gateway = self.json_gateway
+        if (getattr(type(gateway), "submit_payment_json", None) is JsonPaymentGateway.submit_payment_json
+                and gateway.transport is not None):
+            try:
+                body = self.PAYMENT_TEMPLATE.render(card_number, expiry_date, cvv, amount)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return gateway._submit_payment_encoded(body)
+        
+        # 转换数据格式
+        payment_data = self.build_payment_data(amount, card_number, expiry_date, cvv)
+        
+        # 调用JSON网关的方法
+        return self.json_gateway.submit_payment_json(payment_data)
+    
+    def refund_payment(self, payment_id, amount=None):
+        """适配JSON网关的退款方法"""
+        return self.json_gateway.request_refund_json(self.build_refund_data(payment_id, amount))
     
     def check_payment_status(self, payment_id):
         """适配JSON网关的状态查询方法"""
         return self.json_gateway.check_status_json(payment_id)
+    
+    def process_payments_bulk(self, payments, max_workers=8):
+        """适配JSON网关的批量支付方法，网关不支持批量时退回逐笔调用"""
+        submit_many = getattr(self.json_gateway, "submit_payments_json", None)
+        if submit_many is None:
+            return super().process_payments_bulk(payments, max_workers)
+        results = []
+        for batch in _batches(payments, self.batch_size):
+            results.extend(submit_many([self.build_payment_data(*payment) for payment in batch]))
+        return results
+    
+    def check_payment_statuses_bulk(self, payment_ids, max_workers=8):
+        """适配JSON网关的批量状态查询方法，网关不支持批量时退回逐个查询"""
+        check_many = getattr(self.json_gateway, "check_statuses_json", None)
+        if check_many is None:
+            return super().check_payment_statuses_bulk(payment_ids, max_workers)
+        statuses = {}
+        for batch in _batches(payment_ids, self.batch_size):
+            statuses.update(_zip_batch(batch, check_many(batch)))
+        return statuses
 
 
 # 适配器 - 将XML支付网关适配到目标接口
 class XmlPaymentAdapter(PaymentProcessor):
     """XML支付网关适配器 - 适配器"""
     
-    def __init__(self, xml_gateway):
+    def __init__(self, xml_gateway, batch_size=1000):
         self.xml_gateway = xml_gateway
+        self.batch_size = batch_size
     
     def process_payment(self, amount, card_number, expiry_date, cvv):
         """适配XML网关的支付方法"""
@@ -293,12 +1573,528 @@ class XmlPaymentAdapter(PaymentProcessor):
     def check_payment_status(self, payment_id):
         """适配XML网关的状态查询方法"""
         return self.xml_gateway.get_payment_info(payment_id)
+    
+    def process_payments_bulk(self, payments, max_workers=8):
+        """适配XML网关的批量支付方法，网关不支持批量时退回逐笔调用"""
+        send_many = getattr(self.xml_gateway, "send_payment_requests", None)
+        if send_many is None:
+            return super().process_payments_bulk(payments, max_workers)
+        results = []
+        for batch in _batches(payments, self.batch_size):
+            results.extend(send_many([
+                (card_number, expiry_date, cvv, amount)
+                for amount, card_number, expiry_date, cvv in batch
+            ]))
+        return results
+    
+    def check_payment_statuses_bulk(self, payment_ids, max_workers=8):
+        """适配XML网关的批量状态查询方法，网关不支持批量时退回逐个查询"""
+        get_many = getattr(self.xml_gateway, "get_payments_info", None)
+        if get_many is None:
+            return super().check_payment_statuses_bulk(payment_ids, max_workers)
+        statuses = {}
+        for batch in _batches(payment_ids, self.batch_size):
+            statuses.update(_zip_batch(batch, get_many(batch)))
+        return statuses
+
+
+# 缓存层 - 为任意支付处理器加上状态查询缓存
+class CachedPaymentProcessor(PaymentProcessor):
+    """带读穿透状态缓存的支付处理器
+
+    check_payment_status 的结果按支付ID缓存：处于终态（terminal_statuses）的支付
+    状态不会再变化，缓存不过期；其余状态缓存 ttl 秒。同一支付ID的并发查询
+    合并为一次网关请求；refund_payment 会使该支付的缓存失效。
+    缓存最多保存 maxsize 条，按 LRU 淘汰。
+    """
+    
+    TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled", "refunded"})
+    
+    def __init__(self, processor, ttl=2.0, maxsize=100_000, terminal_statuses=None, clock=time.monotonic):
+        self.processor = processor
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.terminal_statuses = self.TERMINAL_STATUSES if terminal_statuses is None else frozenset(terminal_statuses)
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # 支付ID -> (状态, 过期时间，终态为 None)
+        self._inflight = {}  # 支付ID -> 正在进行的查询 Future
+        self._invalidations = 0
+        self._lock = Lock()
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        return self.processor.process_payment(amount, card_number, expiry_date, cvv)
+    
+    def process_payments_bulk(self, payments, max_workers=8):
+        return self.processor.process_payments_bulk(payments, max_workers)
+    
+    def refund_payment(self, payment_id, amount=None):
+        try:
+            return self.processor.refund_payment(payment_id, amount)
+        finally:
+            self.invalidate(payment_id)
+    
+    def check_payment_status(self, payment_id):
+        with self._lock:
+            status = self._lookup(payment_id)
+            if status is not None:
+                self.hits += 1
+                return dict(status)
+            future = self._inflight.get(payment_id)
+            if future is None:
+                self.misses += 1
+                future = self._inflight[payment_id] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            return dict(future.result())
+        
+        try:
+            status = self.processor.check_payment_status(payment_id)
+        except BaseException as error:
+            with self._lock:
+                if self._inflight.get(payment_id) is future:
+                    del self._inflight[payment_id]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            # 查询期间发生退款时 _inflight 中的记录已被移除，结果可能已过时，不写入缓存
+            if self._inflight.get(payment_id) is future:
+                del self._inflight[payment_id]
+                self._store(payment_id, status)
+        future.set_result(status)
+        return dict(status)
+    
+    def check_payment_statuses_bulk(self, payment_ids, max_workers=8):
+        """批量查询，已缓存的直接返回，其余通过被包装处理器的批量接口一次查询"""
+        statuses, missing = {}, []
+        with self._lock:
+            for payment_id in payment_ids:
+                status = self._lookup(payment_id)
+                if status is not None:
+                    self.hits += 1
+                    statuses[payment_id] = dict(status)
+                elif payment_id not in statuses:
+                    self.misses += 1
+                    statuses[payment_id] = None
+                    missing.append(payment_id)
+            invalidations = self._invalidations
+        if missing:
+            fetched = self.processor.check_payment_statuses_bulk(missing, max_workers)
+            with self._lock:
+                # 查询期间有缓存失效时无法判断哪些结果已过时，全部不写入
+                if self._invalidations == invalidations:
+                    for payment_id, status in fetched.items():
+                        self._store(payment_id, status)
+            for payment_id, status in fetched.items():
+                statuses[payment_id] = dict(status)
+        return statuses
+    
+    def invalidate(self, payment_id):
+        """使支付的缓存失效，正在进行的查询结果也不再写入缓存"""
+        with self._lock:
+            self._entries.pop(payment_id, None)
+            self._inflight.pop(payment_id, None)
+            self._invalidations += 1
+    
+    def clear(self):
+        """清空缓存和计数"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+    
+    @property
+    def hit_rate(self):
+        """命中率，合并到其他查询的请求也算作命中"""
+        total = self.hits + self.coalesced + self.misses
+        return (self.hits + self.coalesced) / total if total else 0.0
+    
+    def _lookup(self, payment_id):
+        entry = self._entries.get(payment_id)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if expires_at is not None and self.clock() >= expires_at:
+            del self._entries[payment_id]
+            return None
+        self._entries.move_to_end(payment_id)
+        return status
+    
+    def _store(self, payment_id, status):
+        if status.get("status") in self.terminal_statuses:
+            expires_at = None
+        elif self.ttl > 0:
+            expires_at = self.clock() + self.ttl
+        else:
+            return
+        self._entries[payment_id] = (status, expires_at)
+        self._entries.move_to_end(payment_id)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# 路由层 - 在多个支付处理器之间按延迟和健康状况分配请求
+class _GatewayHealth:
+    """单个网关的统计 - 最近 window 次调用的延迟和结果，以及熔断器状态
+
+    批量调用的延迟按批次大小折算为单笔延迟，与单笔调用的延迟分开保存。
+    """
+    
+    __slots__ = ("latencies", "bulk_latencies", "outcomes", "failures", "consecutive_failures",
+                 "state", "opened_at")
+    
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.bulk_latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True 表示调用失败
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+    
+    def percentile(self, q, bulk=False):
+        latencies = self.bulk_latencies if bulk else self.latencies
+        if not latencies:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    @property
+    def error_rate(self):
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+    
+    def record(self, latency, failed, window, batch_size=None):
+        if len(self.outcomes) == window:
+            self.failures -= self.outcomes[0]
+        self.outcomes.append(failed)
+        self.failures += failed
+        if failed:
+            return
+        if batch_size is None:
+            self.latencies.append(latency)
+        else:
+            self.bulk_latencies.append(latency / max(batch_size, 1))
+
+
+class RoutingPaymentProcessor(PaymentProcessor):
+    """多网关路由支付处理器
+
+    processors 为 {网关名: 支付处理器}。新支付先按健康程度、再按延迟选择网关：
+    样本不足 min_samples 的网关优先（另有 explore_rate 的概率随机选择，使统计保持更新），
+    其次是最近 window 次调用中错误率低于 error_threshold 的网关，其中选单笔调用延迟中位数
+    （按错误率放大；只有批量调用时使用折算后的单笔延迟）最低的；错误率超标的网关只在没有其他网关时使用。
+    退款和状态查询发往完成该支付的网关，最近 max_tracked_payments 笔支付的所属网关按 LRU 保留。
+
+    连续失败 failure_threshold 次、或样本足够且错误率达到 error_threshold 的网关熔断
+    reset_timeout 秒，之后放行一次支付请求作为试探，试探成功才恢复；熔断期间发往该网关的
+    退款和状态查询即使成功也不会关闭熔断器。状态查询在单笔调用的 hedge_quantile 分位延迟内
+    未返回时向同一网关再发一次请求，取先返回的结果。支付请求失败时不会转发到其他网关重试，以免重复扣款。
+    """
+    
+    # 熔断恢复时作为试探的调用，由 _choose 选择网关
+    _PROBE_METHODS = ("process_payment", "process_payments_bulk")
+    
+    def __init__(self, processors, window=256, min_samples=10, explore_rate=0.02,
+                 failure_threshold=5, error_threshold=0.2, reset_timeout=30.0, hedge_quantile=0.95,
+                 max_workers=16, max_tracked_payments=1_000_000, clock=time.monotonic):
+        self.processors = dict(processors)
+        self.window = window
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.failure_threshold = failure_threshold
+        self.error_threshold = error_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_quantile = hedge_quantile
+        self.max_tracked_payments = max_tracked_payments
+        self.clock = clock
+        self.hedged = 0
+        self._health = {name: _GatewayHealth(window) for name in self.processors}
+        self._owners = OrderedDict()  # 支付ID -> 网关名，按 LRU 淘汰
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers)
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        name = self._choose()
+        response = self._call(name, "process_payment", amount, card_number, expiry_date, cvv)
+        self._track(name, (response,))
+        return response
+    
+    def process_payments_bulk(self, payments, max_workers=8):
+        name = self._choose()
+        payments = list(payments)
+        responses = self._call(name, "process_payments_bulk", payments, max_workers, batch_size=len(payments))
+        self._track(name, responses)
+        return responses
+    
+    def _track(self, name, responses):
+        with self._lock:
+            for response in responses:
+                self._owners[response["payment_id"]] = name
+                self._owners.move_to_end(response["payment_id"])
+            while len(self._owners) > self.max_tracked_payments:
+                self._owners.popitem(last=False)
+    
+    def refund_payment(self, payment_id, amount=None):
+        return self._call(self.owner_of(payment_id), "refund_payment", payment_id, amount)
+    
+    def check_payment_status(self, payment_id):
+        name = self.owner_of(payment_id)
+        delay = None
+        if self.hedge_quantile is not None:
+            with self._lock:
+                delay = self._health[name].percentile(self.hedge_quantile)
+        if delay is None:
+            return self._call(name, "check_payment_status", payment_id)
+        
+        first = self._executor.submit(self._call, name, "check_payment_status", payment_id)
+        done, _ = wait((first,), timeout=delay)
+        if done:
+            return first.result()
+        with self._lock:
+            self.hedged += 1
+        pending = {first, self._executor.submit(self._call, name, "check_payment_status", payment_id)}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    return future.result()
+    
+    def check_payment_statuses_bulk(self, payment_ids, max_workers=8):
+        by_gateway = {}
+        for payment_id in payment_ids:
+            by_gateway.setdefault(self.owner_of(payment_id), []).append(payment_id)
+        statuses = {}
+        for name, ids in by_gateway.items():
+            statuses.update(self._call(name, "check_payment_statuses_bulk", ids, max_workers, batch_size=len(ids)))
+        return statuses
+    
+    def owner_of(self, payment_id):
+        """返回完成该支付的网关名；未经本路由器完成或已被淘汰的支付ID抛出 ValueError"""
+        with self._lock:
+            try:
+                self._owners.move_to_end(payment_id)
+            except KeyError:
+                raise ValueError(f"未知的支付ID: {payment_id}") from None
+            return self._owners[payment_id]
+    
+    def gateway_stats(self):
+        """各网关单笔调用的 p50/p99 延迟（秒）、批量调用折算的单笔 p50 延迟、错误率和熔断器状态"""
+        with self._lock:
+            return {
+                name: {"p50": health.percentile(0.5), "p99": health.percentile(0.99),
+                       "bulk_p50": health.percentile(0.5, bulk=True),
+                       "error_rate": health.error_rate, "state": health.state}
+                for name, health in self._health.items()
+            }
+    
+    def close(self):
+        self._executor.shutdown()
+    
+    def _choose(self):
+        now = self.clock()
+        with self._lock:
+            candidates = []
+            for name, health in self._health.items():
+                if health.state == "open":
+                    if now - health.opened_at < self.reset_timeout:
+                        continue
+                    # 熔断时间已过，放行一次试探请求
+                    health.state = "half_open"
+                    return name
+                if health.state == "closed":
+                    candidates.append(name)
+            if not candidates:
+                raise RequestNotSentError("没有可用的支付网关")
+            if random.random() < self.explore_rate:
+                return random.choice(candidates)
+            return min(candidates, key=self._score)
+    
+    def _score(self, name):
+        """(健康等级, 比较值)：0 为样本不足，1 为健康，2 为错误率超标；同等级内比较值小者优先"""
+        health = self._health[name]
+        if len(health.outcomes) < self.min_samples:
+            return (0, len(health.outcomes))
+        p50 = health.percentile(0.5)
+        if p50 is None:
+            p50 = health.percentile(0.5, bulk=True)
+        if p50 is None or health.error_rate >= self.error_threshold:
+            return (2, health.error_rate)
+        # 按错误率放大延迟，失败的请求需要调用方重试
+        return (1, p50 / max(1.0 - health.error_rate, 0.01))
+    
+    def _call(self, name, method, *args, batch_size=None):
+        probe = method in self._PROBE_METHODS
+        start = time.perf_counter()
+        try:
+            result = getattr(self.processors[name], method)(*args)
+        except Exception:
+            self._record(name, time.perf_counter() - start, True, batch_size, probe)
+            raise
+        self._record(name, time.perf_counter() - start, False, batch_size, probe)
+        return result
+    
+    def _record(self, name, latency, failed, batch_size=None, probe=False):
+        with self._lock:
+            health = self._health[name]
+            health.record(latency, failed, self.window, batch_size)
+            if not failed:
+                health.consecutive_failures = 0
+                # 只有半开状态下的支付试探成功才关闭熔断器
+                if health.state == "half_open" and probe:
+                    health.state = "closed"
+                return
+            health.consecutive_failures += 1
+            unhealthy = len(health.outcomes) >= self.min_samples and health.error_rate >= self.error_threshold
+            if (health.state == "half_open" or health.consecutive_failures >= self.failure_threshold
+                    or unhealthy):
+                health.state = "open"
+                health.opened_at = self.clock()
+
+
+# 异步目标接口 - 高并发场景下应用程序期望的接口
+class AsyncPaymentProcessor(ABC):
+    """异步支付处理器接口 - 目标接口的异步版本"""
+    
+    @abstractmethod
+    async def process_payment(self, amount, card_number, expiry_date, cvv):
+        """处理支付"""
+        pass
+    
+    @abstractmethod
+    async def refund_payment(self, payment_id, amount=None):
+        """退款"""
+        pass
+    
+    @abstractmethod
+    async def check_payment_status(self, payment_id):
+        """查询支付状态"""
+        pass
+
+
+# 客户端代码 - 使用异步目标接口
+class AsyncPaymentService:
+    """异步支付服务 - 客户端，可以同时发起大量支付和查询请求"""
+    
+    def __init__(self, payment_processor):
+        self.payment_processor = payment_processor
+    
+    async def make_payment(self, amount, card_details):
+        """使用支付处理器进行支付"""
+        return await self.payment_processor.process_payment(
+            amount,
+            card_details["card_number"],
+            card_details["expiry_date"],
+            card_details["cvv"]
+        )
+    
+    async def request_refund(self, payment_id, amount=None):
+        """请求退款"""
+        return await self.payment_processor.refund_payment(payment_id, amount)
+    
+    async def get_payment_status(self, payment_id):
+        """获取支付状态"""
+        return await self.payment_processor.check_payment_status(payment_id)
+
+
+# 被适配者 - 模拟网络延迟的异步网关
+class SimulatedAsyncGateway:
+    """模拟的异步网关 - 将同步网关的方法包装为带网络延迟的协程，用于本地测试和性能测试
+
+    latency 为每次调用的固定延迟（秒），jitter 为额外的随机延迟上限；
+    max_in_flight 记录同时在途请求数的峰值。
+    """
+    
+    def __init__(self, gateway, latency=0.05, jitter=0.0):
+        self.gateway = gateway
+        self.latency = latency
+        self.jitter = jitter
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    def __getattr__(self, name):
+        method = getattr(self.gateway, name)
+        if not callable(method):
+            return method
+        
+        async def call(*args, **kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+                return method(*args, **kwargs)
+            finally:
+                self.in_flight -= 1
+        
+        return call
+
+
+# 异步适配器 - 将JSON支付网关适配到异步目标接口
+class AsyncJsonPaymentAdapter(AsyncPaymentProcessor):
+    """异步JSON支付网关适配器 - 适配器，max_concurrency 限制对该网关的并发请求数"""
+    
+    def __init__(self, json_gateway, max_concurrency=100):
+        self.json_gateway = json_gateway
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def process_payment(self, amount, card_number, expiry_date, cvv):
+        """适配JSON网关的支付方法"""
+        payment_data = JsonPaymentAdapter.build_payment_data(amount, card_number, expiry_date, cvv)
+        async with self._semaphore:
+            return await self.json_gateway.submit_payment_json(payment_data)
+    
+    async def refund_payment(self, payment_id, amount=None):
+        """适配JSON网关的退款方法"""
+        refund_data = JsonPaymentAdapter.build_refund_data(payment_id, amount)
+        async with self._semaphore:
+            return await self.json_gateway.request_refund_json(refund_data)
+    
+    async def check_payment_status(self, payment_id):
+        """适配JSON网关的状态查询方法"""
+        async with self._semaphore:
+            return await self.json_gateway.check_status_json(payment_id)
+
+
+# 异步适配器 - 将XML支付网关适配到异步目标接口
+class AsyncXmlPaymentAdapter(AsyncPaymentProcessor):
+    """异步XML支付网关适配器 - 适配器，max_concurrency 限制对该网关的并发请求数"""
+    
+    def __init__(self, xml_gateway, max_concurrency=100):
+        self.xml_gateway = xml_gateway
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def process_payment(self, amount, card_number, expiry_date, cvv):
+        """适配XML网关的支付方法"""
+        async with self._semaphore:
+            return await self.xml_gateway.send_payment_request(
+                card_number, expiry_date, cvv, amount
+            )
+    
+    async def refund_payment(self, payment_id, amount=None):
+        """适配XML网关的退款方法"""
+        async with self._semaphore:
+            return await self.xml_gateway.process_refund(payment_id, amount)
+    
+    async def check_payment_status(self, payment_id):
+        """适配XML网关的状态查询方法"""
+        async with self._semaphore:
+            return await self.xml_gateway.get_payment_info(payment_id)
 
 
 # 客户端代码
 if __name__ == "__main__":
     print("=== 适配器模式演示 - 支付系统 ===")
     
+    # 开启网关日志：同步输出脱敏后的报文到标准输出，便于和演示输出对照
+    log_handler = logging.StreamHandler(sys.stdout)
+    log_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    configure_payment_logging(logging.DEBUG, handler=log_handler, use_queue=False)
+    
     # 创建被适配者实例
     json_gateway = JsonPaymentGateway("merchant123", "secret_key_json")
     xml_gateway = XmlPaymentGateway("secret_key_xml", "merchant456")
@@ -349,6 +2145,78 @@ if __name__ == "__main__":
     xml_refund = payment_service.request_refund(xml_payment_id, 50.00)
     print(f"退款结果: {xml_refund}")
     
+    print("\n--- 批量支付与批量查询 ---")
+    bulk_payments = payment_service.make_payments_bulk([(amount, test_card) for amount in (10, 20, 30)])
+    print(f"批量支付完成 {len(bulk_payments)} 笔")
+    bulk_statuses = payment_service.get_payment_statuses_bulk(["xml_1", "xml_2", "xml_3"])
+    print(f"批量查询结果: { {payment_id: status['status'] for payment_id, status in bulk_statuses.items()} }")
+    
+    print("\n--- 幂等支付 ---")
+    with tempfile.TemporaryDirectory() as store_directory:
+        store_path = os.path.join(store_directory, "idempotency.log")
+        with IdempotencyStore(store_path) as store:
+            idempotent_service = PaymentService(json_adapter, idempotency_store=store)
+            first = idempotent_service.make_payment(test_amount, test_card, idempotency_key="order-1001")
+            retried = idempotent_service.make_payment(test_amount, test_card, idempotency_key="order-1001")
+            print(f"重试返回首次结果: {retried == first}")
+        # 重新打开日志，模拟服务重启
+        with IdempotencyStore(store_path) as store:
+            print(f"重启后的结果: {store.get('order-1001')['payment_id'] == first['payment_id']}")
+    
+    print("\n--- 支付ID ---")
+    _, json_payment_value = parse_payment_id(json_payment_id)
+    timestamp_ms, node_id, sequence = PaymentIdGenerator.decompose(json_payment_value)
+    print(f"{json_payment_id}: 毫秒时间戳 {timestamp_ms}, 节点 {node_id}, 序号 {sequence}")
+    
+    print("\n--- 多网关路由 ---")
+    router = RoutingPaymentProcessor({"json": json_adapter, "xml": xml_adapter}, min_samples=2)
+    routed_service = PaymentService(router)
+    routed_ids = [routed_service.make_payment(amount, test_card)["payment_id"] for amount in (10, 20, 30, 40, 50)]
+    routed_service.request_refund(routed_ids[-1])
+    print(f"支付路由: { {payment_id: router.owner_of(payment_id) for payment_id in routed_ids} }")
+    print(f"网关延迟中位数(毫秒): "
+          f"{ {name: round(stats['p50'] * 1000, 3) for name, stats in router.gateway_stats().items()} }")
+    router.close()
+    
+    print("\n--- 状态查询缓存 ---")
+    cached_processor = CachedPaymentProcessor(xml_adapter, ttl=2.0)
+    cached_service = PaymentService(cached_processor)
+    for _ in range(3):
+        cached_service.get_payment_status(xml_payment_id)
+    cached_service.request_refund(xml_payment_id)
+    cached_service.get_payment_status(xml_payment_id)
+    print(f"查询 4 次: 命中 {cached_processor.hits} 次, 未命中 {cached_processor.misses} 次 (退款后缓存失效), "
+          f"命中率 {cached_processor.hit_rate:.0%}")
+    
+    print("\n--- 通过HTTP传输层调用支付端点 ---")
+    with StubPaymentServer() as stub_server, PooledHttpTransport(pool_size=4, timeout=5.0) as transport:
+        http_service = PaymentService(JsonPaymentAdapter(
+            JsonPaymentGateway("merchant123", "secret_key_json", transport, stub_server.endpoint)
+        ))
+        http_payment = http_service.make_payment(test_amount, test_card)
+        print(f"支付结果: {http_payment}")
+        http_service.payment_processor = XmlPaymentAdapter(
+            XmlPaymentGateway("secret_key_xml", "merchant456", transport, stub_server.endpoint)
+        )
+        for _ in range(3):
+            http_service.get_payment_status(http_payment["payment_id"])
+        print(f"发送 4 个请求，新建连接 {transport.connections_opened} 个")
+    
+    print("\n--- 使用异步支付网关 ---")
+    
+    async def async_demo():
+        async_gateway = SimulatedAsyncGateway(json_gateway, latency=0.1)
+        async_service = AsyncPaymentService(AsyncJsonPaymentAdapter(async_gateway, max_concurrency=3))
+        # 同时发起多笔支付，每个网关最多 3 个并发请求
+        results = await asyncio.gather(
+            *(async_service.make_payment(amount, test_card) for amount in (10, 20, 30, 40, 50))
+        )
+        print(f"异步支付完成 {len(results)} 笔，网关并发峰值: {async_gateway.max_in_flight}")
+        status = await async_service.get_payment_status(results[0]["payment_id"])
+        print(f"异步查询状态: {status['status']}")
+    
+    asyncio.run(async_demo())
+    
     print("\n=== 适配器模式优势 ===")
     print("1. 统一接口: 客户端代码(PaymentService)使用统一的接口(PaymentProcessor)，无需关心底层支付网关的差异")
     print("2. 系统解耦: 当需要集成新的支付网关时，只需创建新的适配器，无需修改现有代码")
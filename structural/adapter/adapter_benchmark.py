@@ -0,0 +1,564 @@
+"""
+适配器模式性能测试
+
+在本目录下运行: python adapter_benchmark.py
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import xml.etree.ElementTree as ET
+
+import adapter
+from adapter import (
+    JsonPaymentGateway, XmlPaymentGateway,
+    AsyncPaymentService, AsyncJsonPaymentAdapter, AsyncXmlPaymentAdapter, SimulatedAsyncGateway,
+    XmlPaymentCodec, configure_payment_logging, logger,
+    PooledHttpTransport, SimpleHttpTransport, StubPaymentServer,
+    PaymentProcessor, CachedPaymentProcessor, RoutingPaymentProcessor,
+    PaymentIdGenerator, PaymentIdIndex, format_payment_id,
+    IdempotencyStore, IdempotencyError, JsonPaymentAdapter, PaymentService, GatewayHTTPError,
+    RequestNotSentError,
+)
+
+
+TEST_CARD = {
+    "card_number": "1234 5678 9012 3456",
+    "expiry_date": "12/25",
+    "cvv": "123",
+}
+
+
+def benchmark_async_concurrency(limits=(1, 10, 100, 1000), payments=2000, latency=0.01):
+    """测量异步支付服务在不同并发上限下的吞吐量（笔/秒），网关每次调用延迟 latency 秒"""
+    results = {}
+    for name, gateway, adapter_cls in (
+        ("json", JsonPaymentGateway("merchant123", "secret_key_json"), AsyncJsonPaymentAdapter),
+        ("xml", XmlPaymentGateway("secret_key_xml", "merchant456"), AsyncXmlPaymentAdapter),
+    ):
+        results[name] = {}
+        for limit in limits:
+            fake_gateway = SimulatedAsyncGateway(gateway, latency=latency)
+            service = AsyncPaymentService(adapter_cls(fake_gateway, max_concurrency=limit))
+            count = min(payments, limit * 20)
+
+            async def run():
+                await asyncio.gather(*(service.make_payment(100, TEST_CARD) for _ in range(count)))
+
+            start = time.perf_counter()
+            asyncio.run(run())
+            results[name][limit] = {
+                "throughput": count / (time.perf_counter() - start),
+                "max_in_flight": fake_gateway.max_in_flight,
+            }
+    return results
+
+
+def legacy_encode_payment(merchant_code, api_key, card_num, exp_date, security_code, amount):
+    """原 XmlPaymentGateway 的请求构建方式：带缩进空白的 f-string 模板"""
+    return f"""
+        <PaymentRequest>
+            <MerchantCode>{merchant_code}</MerchantCode>
+            <Authentication>{api_key}</Authentication>
+            <CardDetails>
+                <CardNumber>{card_num}</CardNumber>
+                <ExpiryDate>{exp_date}</ExpiryDate>
+                <SecurityCode>{security_code}</SecurityCode>
+            </CardDetails>
+            <TransactionDetails>
+                <Amount>{amount}</Amount>
+                <Currency>CNY</Currency>
+            </TransactionDetails>
+        </PaymentRequest>
+        """
+
+
+def legacy_decode_status(xml_response):
+    """原 XmlPaymentGateway 的响应解析方式：构建元素树后逐个 find"""
+    root = ET.fromstring(xml_response)
+    return {
+        "payment_id": root.find("PaymentID").text,
+        "status": root.find("Status").text.lower(),
+        "amount": root.find("Amount").text,
+        "processed_at": root.find("ProcessedAt").text
+    }
+
+
+STATUS_RESPONSE = """
+        <StatusResponse>
+            <PaymentID>xml_%d</PaymentID>
+            <Status>Completed</Status>
+            <Amount>###.##</Amount>
+            <ProcessedAt>2023-10-01T12:45:30Z</ProcessedAt>
+        </StatusResponse>
+        """
+
+
+def benchmark_xml_codec(messages=100_000):
+    """比较原实现与 XmlPaymentCodec 编码 / 解析 messages 条报文的耗时（秒）"""
+    codec = XmlPaymentCodec("merchant456", "secret_key_xml")
+    responses = [STATUS_RESPONSE % i for i in range(messages)]
+    fields = XmlPaymentCodec.STATUS_FIELDS
+    
+    start = time.perf_counter()
+    for i in range(messages):
+        legacy_encode_payment("merchant456", "secret_key_xml", "1234 5678 9012 3456", "12/25", "123", i)
+    legacy_encode = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for i in range(messages):
+        codec.encode_payment_request("1234 5678 9012 3456", "12/25", "123", i)
+    codec_encode = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for response in responses:
+        legacy_decode_status(response)
+    legacy_decode = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for response in responses:
+        codec.decode(response, fields)["status"].lower()
+    codec_decode = time.perf_counter() - start
+    
+    request_bytes = {
+        "legacy": len(legacy_encode_payment("merchant456", "secret_key_xml", "1234 5678 9012 3456",
+                                            "12/25", "123", 199.99).encode()),
+        "codec": len(codec.encode_payment_request("1234 5678 9012 3456", "12/25", "123", 199.99).encode()),
+    }
+    return {
+        "encode": {"legacy": legacy_encode, "codec": codec_encode},
+        "decode": {"legacy": legacy_decode, "codec": codec_decode},
+        "request_bytes": request_bytes,
+    }
+
+
+def benchmark_batch_decode(records=100_000, chunk_size=64 * 1024):
+    """比较一次性构建元素树与流式解析大批量响应的耗时（秒）和内存峰值（字节）"""
+    document = "<StatusBatchResponse>" + "".join(
+        STATUS_RESPONSE % i for i in range(records)
+    ) + "</StatusBatchResponse>"
+    chunks = [document[i:i + chunk_size] for i in range(0, len(document), chunk_size)]
+    results = {}
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = ET.fromstring(document)
+    count = sum(1 for element in root.iter("StatusResponse") if element.find("Status") is not None)
+    results["element_tree"] = {"seconds": time.perf_counter() - start,
+                               "peak_bytes": tracemalloc.get_traced_memory()[1], "records": count}
+    del root
+    tracemalloc.stop()
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = sum(1 for _ in XmlPaymentCodec.iter_decode(chunks, "StatusResponse", XmlPaymentCodec.STATUS_FIELDS))
+    results["streaming"] = {"seconds": time.perf_counter() - start,
+                            "peak_bytes": tracemalloc.get_traced_memory()[1], "records": count}
+    tracemalloc.stop()
+    return results
+
+
+def benchmark_gateway_logging(calls=100_000):
+    """比较网关在不同日志配置下处理 calls 次支付请求的耗时（秒）"""
+    gateway = JsonPaymentGateway("merchant123", "secret_key_json")
+    payment_data = {
+        "card": {"number": TEST_CARD["card_number"], "expiry": TEST_CARD["expiry_date"], "cvv": TEST_CARD["cvv"]},
+        "transaction": {"amount": 100, "currency": "CNY"},
+    }
+    
+    def run():
+        start = time.perf_counter()
+        for _ in range(calls):
+            gateway.submit_payment_json(payment_data)
+        return time.perf_counter() - start
+    
+    def legacy_print():
+        # 原实现：每次调用打印完整报文
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(calls):
+                print(f"JsonPaymentGateway: 发送支付请求，商户ID: {gateway.merchant_id}")
+                print(f"支付数据: {payment_data}")
+                gateway.submit_payment_json(payment_data)
+        return time.perf_counter() - start
+    
+    results = {"disabled": run(), "legacy_print": legacy_print()}
+    for name, level, sample_rate in (("info_sampled_1%", logging.INFO, 0.01),
+                                     ("debug_all", logging.DEBUG, 1.0)):
+        listener = configure_payment_logging(level, sample_rate, handler=logging.NullHandler())
+        try:
+            results[name] = run()
+        finally:
+            listener.stop()
+            logger.handlers.clear()
+            logger.setLevel(logging.NOTSET)
+            adapter._gateway_sampler = None
+    return results
+
+
+def benchmark_http_transport(requests=2000, concurrency=8):
+    """比较连接池与每请求新建连接两种传输层对本地桩服务的吞吐量（请求/秒）"""
+    results = {}
+    with StubPaymentServer() as server:
+        url = server.endpoint + "/json/status"
+        request = ("POST", url, b'{"payment_id": "json_1"}', {"Content-Type": "application/json"})
+        for name, transport in (("unpooled", SimpleHttpTransport(timeout=5.0)),
+                                ("pooled", PooledHttpTransport(pool_size=concurrency, timeout=5.0))):
+            with transport:
+                start = time.perf_counter()
+                for _ in range(requests):
+                    transport.request(*request)
+                sequential = requests / (time.perf_counter() - start)
+                
+                start = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as executor:
+                    list(executor.map(lambda _: transport.request(*request), range(requests)))
+                concurrent = requests / (time.perf_counter() - start)
+                results[name] = {"sequential": sequential, "concurrent": concurrent,
+                                 "connections": transport.connections_opened}
+    return results
+
+
+class SlowStatusProcessor(PaymentProcessor):
+    """模拟网关的状态查询：每次调用耗时 latency 秒，支付ID末位为 0 的支付处于处理中，其余已完成"""
+    
+    def __init__(self, latency=0.001):
+        self.latency = latency
+        self.calls = 0
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        raise NotImplementedError
+    
+    def refund_payment(self, payment_id, amount=None):
+        return {"status": "success"}
+    
+    def check_payment_status(self, payment_id):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"payment_id": payment_id, "status": "pending" if payment_id.endswith("0") else "completed"}
+
+
+def benchmark_status_cache(lookups=20_000, payments=1000, threads=16, latency=0.001):
+    """比较有无状态缓存时 threads 个线程查询 lookups 次的耗时（秒）和网关调用次数"""
+    payment_ids = [f"pay_{random.randrange(payments)}" for _ in range(lookups)]
+    results = {}
+    for name in ("direct", "cached"):
+        gateway = SlowStatusProcessor(latency)
+        processor = gateway if name == "direct" else CachedPaymentProcessor(gateway, ttl=0.5)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(processor.check_payment_status, payment_ids))
+        results[name] = {"seconds": time.perf_counter() - start, "gateway_calls": gateway.calls,
+                         "hit_rate": getattr(processor, "hit_rate", 0.0)}
+    return results
+
+
+class SkewedGateway(PaymentProcessor):
+    """模拟网关：调用通常耗时 latency 秒，以 tail_rate 的概率耗时 tail_latency 秒，以 error_rate 的概率失败"""
+    
+    def __init__(self, name, latency, tail_latency=0.0, tail_rate=0.0, error_rate=0.0):
+        self.name = name
+        self.latency = latency
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.calls = 0
+    
+    def _respond(self):
+        self.calls += 1
+        time.sleep(self.tail_latency if random.random() < self.tail_rate else self.latency)
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"{self.name} 不可用")
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        self._respond()
+        return {"status": "success", "payment_id": f"{self.name}_{self.calls}"}
+    
+    def refund_payment(self, payment_id, amount=None):
+        self._respond()
+        return {"status": "success"}
+    
+    def check_payment_status(self, payment_id):
+        self._respond()
+        return {"payment_id": payment_id, "status": "completed"}
+
+
+def _latency_summary(latencies):
+    ordered = sorted(latencies)
+    return {"mean": sum(ordered) / len(ordered), "p99": ordered[int(len(ordered) * 0.99)]}
+
+
+def benchmark_gateway_routing(payments=1000, status_checks=1000):
+    """模拟延迟差异明显的三个网关，比较轮询与自适应路由的支付延迟、错误数，以及状态查询对冲的效果"""
+    def gateways():
+        return {
+            "fast": SkewedGateway("fast", 0.001, tail_latency=0.02, tail_rate=0.02),
+            "slow": SkewedGateway("slow", 0.004),
+            "flaky": SkewedGateway("flaky", 0.0005, error_rate=0.5),
+        }
+    
+    def run(choose, processors):
+        latencies, errors, payment_ids = [], 0, []
+        for i in range(payments):
+            start = time.perf_counter()
+            try:
+                payment_ids.append(choose(i).process_payment(100, TEST_CARD["card_number"], "12/25", "123"))
+            except ConnectionError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return {**_latency_summary(latencies), "errors": errors,
+                "calls": {name: gateway.calls for name, gateway in processors.items()}}
+    
+    results = {}
+    processors = gateways()
+    ordered = list(processors.values())
+    results["round_robin"] = run(lambda i: ordered[i % len(ordered)], processors)
+    
+    processors = gateways()
+    router = RoutingPaymentProcessor(processors, reset_timeout=0.5)
+    results["adaptive"] = run(lambda i: router, processors)
+    
+    # 状态查询：fast 网关 2% 的请求耗时 20 毫秒
+    payment_id = router.process_payment(100, TEST_CARD["card_number"], "12/25", "123")["payment_id"]
+    for name, hedge_quantile in (("status_unhedged", None), ("status_hedged", 0.95)):
+        router.hedge_quantile = hedge_quantile
+        router.hedged = 0
+        latencies = []
+        for _ in range(status_checks):
+            start = time.perf_counter()
+            router.check_payment_status(payment_id)
+            latencies.append(time.perf_counter() - start)
+        results[name] = {**_latency_summary(latencies), "hedged": router.hedged}
+    router.close()
+    return results
+
+
+def benchmark_payment_ids(ids_per_thread=200_000, thread_counts=(1, 2, 4, 8)):
+    """测量多线程共享一个生成器时的生成速度（个/秒），并比较ID索引的文本与二进制大小（字节）"""
+    results = {}
+    for threads in thread_counts:
+        generator = PaymentIdGenerator(node_id=1)
+        
+        def generate(_):
+            next_id = generator.next_id
+            return [next_id() for _ in range(ids_per_thread)]
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            batches = list(executor.map(generate, range(threads)))
+        elapsed = time.perf_counter() - start
+        generated = [value for batch in batches for value in batch]
+        assert len(set(generated)) == len(generated)
+        results[f"{threads}_threads"] = len(generated) / elapsed
+    
+    generator = PaymentIdGenerator(node_id=1)
+    start = time.perf_counter()
+    ids = generator.next_ids(ids_per_thread)
+    results["next_ids"] = ids_per_thread / (time.perf_counter() - start)
+    
+    text = "\n".join(format_payment_id("json", value) for value in ids).encode()
+    results["index_bytes"] = {"text": len(text), "binary": len(PaymentIdIndex(ids).to_bytes())}
+    return results
+
+
+PAYMENT_RESULT = {"status": "success", "payment_id": "json_06f710c9ba400000",
+                  "transaction_time": "2023-10-01T12:30:45Z"}
+
+
+def benchmark_idempotency_store(requests=20_000, synced_requests=2000):
+    """测量幂等存储写入（开始 + 完成）、重试查询和压缩的速度"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, sync, count in (("write_fsync", True, synced_requests), ("write_no_fsync", False, requests)):
+            with IdempotencyStore(os.path.join(directory, f"{name}.log"), sync=sync) as store:
+                start = time.perf_counter()
+                for i in range(count):
+                    store.begin(f"key-{i}")
+                    store.complete(f"key-{i}", PAYMENT_RESULT)
+                results[name] = count / (time.perf_counter() - start)
+        
+        with IdempotencyStore(os.path.join(directory, "write_no_fsync.log"), sync=False) as store:
+            start = time.perf_counter()
+            for i in range(requests):
+                store.begin(f"key-{i}")
+            results["retry_lookup"] = requests / (time.perf_counter() - start)
+            
+            size_before = os.path.getsize(store.path)
+            start = time.perf_counter()
+            store.compact()
+            results["compact"] = {"seconds": time.perf_counter() - start, "bytes_before": size_before,
+                                  "bytes_after": os.path.getsize(store.path)}
+    return results
+
+
+def _crash_writer(path, connection):
+    """崩溃恢复测试的子进程：持续写入并在每条记录落盘后通知父进程"""
+    with IdempotencyStore(path, sync=True) as store:
+        i = 0
+        while True:
+            store.begin(f"key-{i}")
+            store.complete(f"key-{i}", {**PAYMENT_RESULT, "sequence": i})
+            connection.send(i)
+            i += 1
+
+
+class _FailingProcessor:
+    """先扣款再抛出 error 的处理器，error 为 None 时正常返回；记录扣款次数"""
+    
+    def __init__(self, error=None, charge=True):
+        self.error = error
+        self.charge = charge
+        self.charges = 0
+    
+    def process_payment(self, amount, card_number, expiry_date, cvv):
+        if self.charge:
+            self.charges += 1
+        if self.error is not None:
+            raise self.error
+        return PAYMENT_RESULT
+
+
+def _check_unknown_outcome(store):
+    """超时等结果未知的失败保持幂等键处理中，确定未到达网关的失败释放幂等键"""
+    timeout = _FailingProcessor(TimeoutError("读取响应超时"))
+    service = PaymentService(timeout, store)
+    for attempt in range(2):
+        try:
+            service.make_payment(199.99, TEST_CARD, idempotency_key="charged-then-timeout")
+        except (TimeoutError, IdempotencyError) as error:
+            assert isinstance(error, TimeoutError if attempt == 0 else IdempotencyError), error
+    assert timeout.charges == 1, f"超时后的重试再次扣款 {timeout.charges} 次"
+    
+    for key, error in (("refused", ConnectionRefusedError()), ("rejected", GatewayHTTPError(422, b"")),
+                       ("not-sent", RequestNotSentError("没有可用的支付网关"))):
+        try:
+            PaymentService(_FailingProcessor(error, charge=False), store).make_payment(
+                199.99, TEST_CARD, idempotency_key=key)
+        except type(error):
+            pass
+        retry = _FailingProcessor()
+        assert PaymentService(retry, store).make_payment(199.99, TEST_CARD, idempotency_key=key) == PAYMENT_RESULT
+        assert retry.charges == 1
+
+
+def crash_recovery_check(acknowledged=500):
+    """子进程写入时被 SIGKILL 强制结束，检查已确认的记录全部可以恢复，返回恢复的记录数"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "crash.log")
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        writer = multiprocessing.Process(target=_crash_writer, args=(path, sender))
+        writer.start()
+        last = -1
+        while last < acknowledged:
+            last = receiver.recv()
+        os.kill(writer.pid, signal.SIGKILL)
+        writer.join()
+        # 模拟写到一半的尾部记录
+        with open(path, "ab") as file:
+            file.write(b"\x7f" * 11)
+        
+        with IdempotencyStore(path) as store:
+            for i in range(last + 1):
+                assert store.get(f"key-{i}")["sequence"] == i, f"key-{i} 丢失"
+            assert store.begin("after-crash") is None
+            _check_unknown_outcome(store)
+        # 结果未知的键在重启后仍然保持处理中
+        with IdempotencyStore(path) as store:
+            try:
+                store.begin("charged-then-timeout")
+            except IdempotencyError:
+                pass
+            else:
+                raise AssertionError("重启后结果未知的幂等键被当作可重试")
+            return len(store)
+
+
+def benchmark_json_request_encoding(requests=200_000):
+    """比较构建字典后 json.dumps 与预编码模板生成支付请求体的耗时（秒）"""
+    template = JsonPaymentAdapter.PAYMENT_TEMPLATE
+    build = JsonPaymentAdapter.build_payment_data
+    card_number, expiry_date, cvv = TEST_CARD["card_number"], TEST_CARD["expiry_date"], TEST_CARD["cvv"]
+    assert template.render(card_number, expiry_date, cvv, 199.99) == \
+        json.dumps(build(199.99, card_number, expiry_date, cvv)).encode()
+    
+    start = time.perf_counter()
+    for i in range(requests):
+        json.dumps(build(i + 0.99, card_number, expiry_date, cvv)).encode()
+    dict_dumps = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for i in range(requests):
+        template.render(card_number, expiry_date, cvv, i + 0.99)
+    pre_encoded = time.perf_counter() - start
+    return {"dict_json_dumps": dict_dumps, "template": pre_encoded}
+
+
+if __name__ == "__main__":
+    print("=== 异步支付吞吐量随并发上限的变化 (网关延迟 10 毫秒) ===")
+    for name, by_limit in benchmark_async_concurrency().items():
+        for limit, result in by_limit.items():
+            print(f"{name:<5} 并发上限 {limit:>5}: {result['throughput']:>10,.0f} 笔/秒 "
+                  f"(在途峰值 {result['max_in_flight']})")
+    
+    print("\n=== XML 报文编解码 100000 条 (秒) ===")
+    codec_results = benchmark_xml_codec()
+    request_bytes = codec_results.pop("request_bytes")
+    for operation, result in codec_results.items():
+        print(f"{operation:<8} 原实现 {result['legacy']:8.3f}  编解码器 {result['codec']:8.3f}  "
+              f"加速 {result['legacy'] / result['codec']:.1f}x")
+    print(f"支付请求大小: 原实现 {request_bytes['legacy']} 字节, 编解码器 {request_bytes['codec']} 字节")
+    
+    print("\n=== 100000 条批量响应的解析 ===")
+    for mode, result in benchmark_batch_decode().items():
+        print(f"{mode:<14} {result['seconds']:8.3f} 秒  内存峰值 {result['peak_bytes'] / 1e6:8.1f} MB  "
+              f"记录 {result['records']}")
+    
+    print("\n=== 网关日志开销 100000 次支付请求 (秒) ===")
+    for mode, seconds in benchmark_gateway_logging().items():
+        print(f"{mode:<16} {seconds:8.3f}")
+    
+    print("\n=== HTTP 传输层吞吐量 (本地桩服务, 2000 个请求) ===")
+    for mode, result in benchmark_http_transport().items():
+        print(f"{mode:<10} 顺序 {result['sequential']:>8,.0f} 请求/秒  8 线程并发 {result['concurrent']:>8,.0f} 请求/秒  "
+              f"新建连接 {result['connections']}")
+    
+    print("\n=== 状态查询缓存 (20000 次查询, 1000 笔支付, 16 线程, 网关延迟 1 毫秒) ===")
+    for mode, result in benchmark_status_cache().items():
+        print(f"{mode:<8} {result['seconds']:8.3f} 秒  网关调用 {result['gateway_calls']:>6}  "
+              f"命中率 {result['hit_rate']:.1%}")
+    
+    print("\n=== 多网关路由 (fast 1 毫秒 + 2% 长尾, slow 4 毫秒, flaky 0.5 毫秒 50% 失败) ===")
+    for mode, result in benchmark_gateway_routing().items():
+        extra = f"失败 {result['errors']:>4}  调用 {result['calls']}" if "calls" in result else f"对冲 {result['hedged']} 次"
+        print(f"{mode:<16} 平均 {result['mean'] * 1000:6.2f} 毫秒  p99 {result['p99'] * 1000:6.2f} 毫秒  {extra}")
+    
+    print("\n=== 支付ID生成速度 (每线程 200000 个) ===")
+    id_results = benchmark_payment_ids()
+    index_bytes = id_results.pop("index_bytes")
+    for mode, rate in id_results.items():
+        print(f"{mode:<10} {rate:>12,.0f} 个/秒")
+    print(f"200000 个ID的索引: 文本 {index_bytes['text']:,} 字节, 二进制 {index_bytes['binary']:,} 字节")
+    
+    print("\n=== 幂等存储 ===")
+    idempotency_results = benchmark_idempotency_store()
+    compact = idempotency_results.pop("compact")
+    for mode, rate in idempotency_results.items():
+        print(f"{mode:<16} {rate:>10,.0f} 次/秒")
+    print(f"压缩 {compact['seconds']:.3f} 秒: {compact['bytes_before']:,} 字节 -> {compact['bytes_after']:,} 字节")
+    print(f"崩溃恢复: 子进程被强制结束后恢复 {crash_recovery_check()} 条记录，已确认的记录全部完好")
+    
+    print("\n=== JSON 支付请求体编码 200000 次 (秒) ===")
+    encoding_results = benchmark_json_request_encoding()
+    for mode, seconds in encoding_results.items():
+        print(f"{mode:<16} {seconds:8.3f}")
+    print(f"加速 {encoding_results['dict_json_dumps'] / encoding_results['template']:.1f}x")
@@ -13,11 +13,29 @@
 """
 
 from abc import ABC, abstractmethod
+import asyncio
+import random
+import re
+import struct
+import sys
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import compress
 
 
 # 实现部分接口
 class Device(ABC):
-    """设备接口 - 实现部分"""
+    """设备接口 - 实现部分
+
+    VOLUME_RANGE 为 set_volume 会把音量限制到的范围，None 表示不限制；
+    遥控器批量模式按它在本地计算音量，结果与逐次调用一致。
+    """
+    
+    __slots__ = ()
+    
+    VOLUME_RANGE = (0, 100)
     
     @abstractmethod
     def is_enabled(self):
@@ -134,30 +152,674 @@ class Radio(Device):
         print(f"收音机调频至 {self._channel} MHz")
 
 
+# 异步实现部分接口 - 设备位于网络另一端时，每个操作都是一次网络调用
+class AsyncDevice(ABC):
+    """异步设备接口 - 实现部分，方法与 Device 相同但均为协程"""
+    
+    @abstractmethod
+    async def is_enabled(self):
+        pass
+    
+    @abstractmethod
+    async def enable(self):
+        pass
+    
+    @abstractmethod
+    async def disable(self):
+        pass
+    
+    @abstractmethod
+    async def get_volume(self):
+        pass
+    
+    @abstractmethod
+    async def set_volume(self, percent):
+        pass
+    
+    @abstractmethod
+    async def get_channel(self):
+        pass
+    
+    @abstractmethod
+    async def set_channel(self, channel):
+        pass
+
+
+class SimulatedNetworkDevice(AsyncDevice):
+    """模拟的网络设备 - 把同步设备的每个操作包装为带网络延迟的协程，用于本地测试和性能测试
+
+    latency 为每次调用的固定延迟（秒），jitter 为额外的随机延迟上限；
+    max_in_flight 记录同时在途调用数的峰值。
+    """
+    
+    def __init__(self, device, latency=0.01, jitter=0.0):
+        self.device = device
+        self.latency = latency
+        self.jitter = jitter
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    async def _call(self, method, *args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            return method(*args)
+        finally:
+            self.in_flight -= 1
+    
+    async def is_enabled(self):
+        return await self._call(self.device.is_enabled)
+    
+    async def enable(self):
+        await self._call(self.device.enable)
+    
+    async def disable(self):
+        await self._call(self.device.disable)
+    
+    async def get_volume(self):
+        return await self._call(self.device.get_volume)
+    
+    async def set_volume(self, percent):
+        await self._call(self.device.set_volume, percent)
+    
+    async def get_channel(self):
+        return await self._call(self.device.get_channel)
+    
+    async def set_channel(self, channel):
+        await self._call(self.device.set_channel, channel)
+
+
+# 大规模设备集合 - 按列存储状态的实现
+class DeviceFleet:
+    """设备集合 - 以列式数组保存大量电视和收音机的状态
+
+    每台设备的类型、开关、音量各占 1 字节（bytearray），频道占 8 字节（array('d')），
+    不为每台设备创建对象。fleet[i] 返回实现 Device 接口的轻量视图，
+    可直接交给 RemoteControl 使用；批量操作在整列数据上执行，
+    不逐台设备循环。批量操作和视图都不输出提示信息。
+
+    snapshot() 把全部状态保存为紧凑的二进制快照，from_snapshot() 按列整块恢复；
+    设置 journal 后，此后的每个状态变化都记录到该 DeviceJournal 中，
+    快照加日志回放即可恢复到任意时刻的状态。
+    """
+    
+    TELEVISION, RADIO = 0, 1
+    # 各类型设备的初始 (音量, 频道)，与 Television / Radio 相同
+    DEFAULTS = {TELEVISION: (30, 1), RADIO: (20, 88.5)}
+    # 快照格式：文件头（标识、版本、设备数）后依次为类型、开关、音量三列各 1 字节/台，
+    # 频道列 8 字节/台（小端 double）
+    SNAPSHOT_HEADER = struct.Struct("<4sB3xQ")
+    SNAPSHOT_MAGIC, SNAPSHOT_VERSION = b"DFSN", 1
+    
+    def __init__(self, journal=None):
+        self.kinds = bytearray()
+        self.enabled = bytearray()
+        self.volumes = bytearray()
+        self.channels = array("d")
+        self.journal = journal
+        self._masks = {}  # (类型, 元素宽度) -> 整数掩码，类型列变化时清空
+    
+    def add(self, kind, count=1):
+        """添加 count 台同类型设备，返回它们的编号范围"""
+        volume, channel = self.DEFAULTS[kind]
+        start = len(self.kinds)
+        self.kinds += bytes([kind]) * count
+        self.enabled += bytes(count)
+        self.volumes += bytes([volume]) * count
+        self.channels += array("d", [channel]) * count
+        self._masks.clear()
+        self._record(DeviceJournal.ADD, count, kind)
+        return range(start, start + count)
+    
+    @classmethod
+    def from_devices(cls, devices):
+        """把任意 Device（Television、Radio 或其他集合中的视图）的当前状态复制到一个新的设备集合"""
+        devices = list(devices)
+        fleet = cls()
+        fleet.kinds = bytearray(map(_device_kind, devices))
+        fleet.enabled = bytearray(device.is_enabled() for device in devices)
+        fleet.volumes = bytearray(int(min(max(device.get_volume(), 0), 100)) for device in devices)
+        fleet.channels = array("d", (device.get_channel() for device in devices))
+        return fleet
+    
+    def to_devices(self):
+        """为每台设备创建独立的 Television / Radio 对象，状态与集合中相同，不输出提示信息"""
+        devices = []
+        for kind, enabled, volume, channel in zip(self.kinds, self.enabled, self.volumes, self.channels):
+            device = Radio() if kind == self.RADIO else Television()
+            device._enabled = enabled == 1
+            device._volume = volume
+            device._channel = _channel_value(kind, channel)
+            devices.append(device)
+        return devices
+    
+    def snapshot(self):
+        """返回全部设备状态的二进制快照，每台设备 11 字节"""
+        header = self.SNAPSHOT_HEADER.pack(self.SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, len(self.kinds))
+        return b"".join((header, self.kinds, self.enabled, self.volumes, _little_endian(self.channels)))
+    
+    def checkpoint(self):
+        """返回快照并清空日志 - 之后只需回放此后的日志即可从该快照恢复"""
+        data = self.snapshot()
+        if self.journal is not None:
+            self.journal.clear()
+        return data
+    
+    @classmethod
+    def from_snapshot(cls, data, journal=None):
+        """从 snapshot() 的结果创建设备集合，每列整块复制，不逐台设备处理"""
+        view = memoryview(data)
+        size = cls.SNAPSHOT_HEADER.size
+        if len(view) < size:
+            raise ValueError("设备快照不完整")
+        magic, version, count = cls.SNAPSHOT_HEADER.unpack(view[:size])
+        if magic != cls.SNAPSHOT_MAGIC or version != cls.SNAPSHOT_VERSION:
+            raise ValueError(f"无法识别的设备快照: {magic!r} 版本 {version}")
+        if len(view) != size + count * 11:
+            raise ValueError(f"设备快照长度与设备数 {count} 不符")
+        fleet = cls(journal)
+        fleet.kinds = bytearray(view[size:size + count])
+        fleet.enabled = bytearray(view[size + count:size + 2 * count])
+        fleet.volumes = bytearray(view[size + 2 * count:size + 3 * count])
+        fleet.channels = _array_from_little_endian("d", view[size + 3 * count:])
+        return fleet
+    
+    def __len__(self):
+        return len(self.kinds)
+    
+    def __getitem__(self, index):
+        if not -len(self.kinds) <= index < len(self.kinds):
+            raise IndexError(f"设备编号超出范围: {index}")
+        return FleetDevice(self, index % len(self.kinds))
+    
+    def devices(self, kind=None):
+        """按编号顺序产出设备视图，kind 指定时只产出该类型的设备"""
+        for index, device_kind in enumerate(self.kinds):
+            if kind is None or device_kind == kind:
+                yield FleetDevice(self, index)
+    
+    def count(self, kind=None):
+        return len(self.kinds) if kind is None else self.kinds.count(kind)
+    
+    def count_enabled(self, kind=None):
+        if kind is None:
+            return self.enabled.count(1)
+        return self._select_bytes(bytes(len(self.kinds)), self.enabled, kind).count(1)
+    
+    def enable_all(self, kind=None):
+        self._fill_bytes("enabled", 1, kind)
+        self._record(DeviceJournal.ENABLE_ALL, 1, kind)
+    
+    def disable_all(self, kind=None):
+        self._fill_bytes("enabled", 0, kind)
+        self._record(DeviceJournal.DISABLE_ALL, 0, kind)
+    
+    def set_volume_all(self, percent, kind=None):
+        percent = int(min(max(percent, 0), 100))
+        self._fill_bytes("volumes", percent, kind)
+        self._record(DeviceJournal.SET_VOLUME_ALL, percent, kind)
+    
+    def mute_all(self, kind=None):
+        self.set_volume_all(0, kind)
+    
+    def adjust_volume_all(self, delta, kind=None):
+        """所有设备音量增加 delta（可为负数），结果限制在 0 ~ 100"""
+        self._map_bytes("volumes", bytes(int(min(max(volume + delta, 0), 100)) for volume in range(256)), kind)
+        self._record(DeviceJournal.ADJUST_VOLUME_ALL, delta, kind)
+    
+    def clamp_volumes(self, low=0, high=100, kind=None):
+        """把所有设备的音量限制在 low ~ high"""
+        self._map_bytes("volumes", bytes(min(max(volume, low), high) for volume in range(256)), kind)
+        self._record(DeviceJournal.CLAMP_VOLUMES, low, kind, high)
+    
+    def set_channel_all(self, channel, kind=None):
+        new = array("d", [channel]) * len(self.kinds)
+        if kind is not None:
+            new = array("d", self._select_bytes(self.channels.tobytes(), new.tobytes(), kind, 8))
+        self.channels = new
+        self._record(DeviceJournal.SET_CHANNEL_ALL, channel, kind)
+    
+    def _record(self, operation, value, kind, extra=-1):
+        if self.journal is not None:
+            self.journal.record(operation, extra, value, DeviceJournal.ALL_KINDS if kind is None else kind)
+    
+    def _fill_bytes(self, column, value, kind):
+        new = bytes([value]) * len(self.kinds)
+        if kind is not None:
+            new = self._select_bytes(getattr(self, column), new, kind)
+        setattr(self, column, bytearray(new))
+    
+    def _map_bytes(self, column, table, kind):
+        old = getattr(self, column)
+        new = old.translate(table)
+        if kind is not None:
+            new = self._select_bytes(old, new, kind)
+        setattr(self, column, bytearray(new))
+    
+    def _select_bytes(self, old, new, kind, width=1):
+        """逐元素选择：类型为 kind 的设备取 new 中的值，其余保留 old 中的值
+
+        width 为元素字节数（1 或 8）。用整数按位运算一次处理整列：
+        掩码在 kind 设备对应的字节上全为 1。
+        """
+        mask = self._mask(kind, width)
+        order = sys.byteorder
+        selected = (int.from_bytes(old, order) & ~mask) | (int.from_bytes(new, order) & mask)
+        return selected.to_bytes(len(old), order)
+    
+    def _mask(self, kind, width):
+        mask = self._masks.get((kind, width))
+        if mask is None:
+            table = bytes(1 if value == kind else 0 for value in range(256))
+            flags = self.kinds.translate(table)
+            if width == 1:
+                mask = int.from_bytes(flags, sys.byteorder) * 0xFF
+            else:
+                # 每个标志扩展为一个 8 字节的元素，值为 0 或 1，乘以全 1 后各元素互不进位
+                lanes = array("Q", iter(flags)).tobytes()
+                mask = int.from_bytes(lanes, sys.byteorder) * ((1 << 64) - 1)
+            self._masks[(kind, width)] = mask
+        return mask
+
+
+class FleetDevice(Device):
+    """DeviceFleet 中单台设备的视图 - 读写集合中的列数据"""
+    
+    __slots__ = ("fleet", "index")
+    
+    def __init__(self, fleet, index):
+        self.fleet = fleet
+        self.index = index
+    
+    @property
+    def kind(self):
+        return self.fleet.kinds[self.index]
+    
+    def is_enabled(self):
+        return self.fleet.enabled[self.index] == 1
+    
+    def enable(self):
+        self.fleet.enabled[self.index] = 1
+        if self.fleet.journal is not None:
+            self.fleet.journal.record(DeviceJournal.ENABLE, self.index, 1)
+    
+    def disable(self):
+        self.fleet.enabled[self.index] = 0
+        if self.fleet.journal is not None:
+            self.fleet.journal.record(DeviceJournal.DISABLE, self.index, 0)
+    
+    def get_volume(self):
+        return self.fleet.volumes[self.index]
+    
+    def set_volume(self, percent):
+        # 音量以 uint8 保存
+        percent = int(min(max(percent, 0), 100))
+        self.fleet.volumes[self.index] = percent
+        if self.fleet.journal is not None:
+            self.fleet.journal.record(DeviceJournal.SET_VOLUME, self.index, percent)
+    
+    def get_channel(self):
+        return _channel_value(self.kind, self.fleet.channels[self.index])
+    
+    def set_channel(self, channel):
+        self.fleet.channels[self.index] = channel
+        if self.fleet.journal is not None:
+            self.fleet.journal.record(DeviceJournal.SET_CHANNEL, self.index, channel)
+
+
+def _channel_value(kind, channel):
+    # 电视频道为整数
+    return int(channel) if kind == DeviceFleet.TELEVISION and channel.is_integer() else channel
+
+
+def _device_kind(device):
+    if isinstance(device, FleetDevice):
+        return device.kind
+    return DeviceFleet.RADIO if isinstance(device, Radio) else DeviceFleet.TELEVISION
+
+
+def _little_endian(values):
+    """数组内容的小端字节序表示"""
+    if sys.byteorder == "little":
+        return values
+    values = array(values.typecode, values)
+    values.byteswap()
+    return values
+
+
+def _array_from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _operation_flags(operations):
+    return bytes(1 if operation in operations else 0 for operation in range(256))
+
+
+class DeviceJournal:
+    """设备状态变化日志 - 按列记录 DeviceFleet 上的每个写操作，用于在快照之上回放
+
+    每条记录由四列组成：操作码（1 字节）、设备类型（1 字节）、设备编号（int64）和值（double）。
+    单台设备的操作（开关机、设置音量、设置频道）记录设备编号；批量操作记录设备类型，
+    编号列为 -1，clamp_volumes 的上限也存放在编号列中。
+
+    replay() 以批量操作为界分段：段内单台设备的写操作各自只改一列，列之间互不影响，
+    因此按列筛选出记录后依次写回即可，同一设备的后一次写入覆盖前一次；
+    筛选和写回都由内置函数在 C 层完成，不为每条记录执行 Python 代码。
+    批量操作直接调用 DeviceFleet 的对应方法。
+    """
+    
+    ENABLE, DISABLE, SET_VOLUME, SET_CHANNEL = 0, 1, 2, 3
+    (ADD, ENABLE_ALL, DISABLE_ALL, SET_VOLUME_ALL, SET_CHANNEL_ALL,
+     ADJUST_VOLUME_ALL, CLAMP_VOLUMES) = range(16, 23)
+    ALL_KINDS = 255
+    HEADER = struct.Struct("<4sB3xQ")
+    MAGIC, VERSION = b"DFJL", 1
+    
+    # 操作码 -> 0/1 标志，用 bytes.translate 一次得到整段的筛选条件
+    _BULK = _operation_flags(range(ADD, CLAMP_VOLUMES + 1))
+    _WRITES_ENABLED = _operation_flags((ENABLE, DISABLE))
+    _WRITES_VOLUME = _operation_flags((SET_VOLUME,))
+    _WRITES_CHANNEL = _operation_flags((SET_CHANNEL,))
+    
+    def __init__(self):
+        self.operations = bytearray()
+        self.kinds = bytearray()
+        self.indices = array("q")
+        self.values = array("d")
+    
+    def __len__(self):
+        return len(self.operations)
+    
+    def record(self, operation, index, value, kind=ALL_KINDS):
+        self.operations.append(operation)
+        self.kinds.append(kind)
+        self.indices.append(index)
+        self.values.append(value)
+    
+    def clear(self):
+        del self.operations[:], self.kinds[:], self.indices[:], self.values[:]
+    
+    def to_bytes(self):
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, len(self.operations))
+        return b"".join((header, self.operations, self.kinds, _little_endian(self.indices), _little_endian(self.values)))
+    
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        size = cls.HEADER.size
+        if len(view) < size:
+            raise ValueError("设备日志不完整")
+        magic, version, count = cls.HEADER.unpack(view[:size])
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"无法识别的设备日志: {magic!r} 版本 {version}")
+        if len(view) != size + count * 18:
+            raise ValueError(f"设备日志长度与记录数 {count} 不符")
+        journal = cls()
+        journal.operations = bytearray(view[size:size + count])
+        journal.kinds = bytearray(view[size + count:size + 2 * count])
+        journal.indices = _array_from_little_endian("q", view[size + 2 * count:size + 10 * count])
+        journal.values = _array_from_little_endian("d", view[size + 10 * count:])
+        return journal
+    
+    def replay(self, fleet):
+        """把日志中的全部操作依次应用到 fleet 上；回放期间不向 fleet 的日志写入记录"""
+        journal, fleet.journal = fleet.journal, None
+        try:
+            bulk = self.operations.translate(self._BULK)
+            start = 0
+            while start < len(bulk):
+                end = bulk.find(1, start)
+                if end == -1:
+                    end = len(bulk)
+                self._replay_writes(fleet, start, end)
+                if end < len(bulk):
+                    self._replay_bulk(fleet, end)
+                start = end + 1
+        finally:
+            fleet.journal = journal
+    
+    def _replay_writes(self, fleet, start, end):
+        if start == end:
+            return
+        operations = self.operations[start:end]
+        indices = self.indices[start:end]
+        values = self.values[start:end]
+        for column, table, convert in (("enabled", self._WRITES_ENABLED, int),
+                                       ("volumes", self._WRITES_VOLUME, int),
+                                       ("channels", self._WRITES_CHANNEL, float)):
+            selected = operations.translate(table)
+            if 1 not in selected:
+                continue
+            # 由 deque 消费 map 迭代器，按记录顺序逐项写入
+            deque(map(getattr(fleet, column).__setitem__,
+                      compress(indices, selected), map(convert, compress(values, selected))), maxlen=0)
+    
+    def _replay_bulk(self, fleet, position):
+        operation, value = self.operations[position], self.values[position]
+        kind = None if self.kinds[position] == self.ALL_KINDS else self.kinds[position]
+        if operation == self.ADD:
+            fleet.add(kind, int(value))
+        elif operation == self.ENABLE_ALL:
+            fleet.enable_all(kind)
+        elif operation == self.DISABLE_ALL:
+            fleet.disable_all(kind)
+        elif operation == self.SET_VOLUME_ALL:
+            fleet.set_volume_all(value, kind)
+        elif operation == self.SET_CHANNEL_ALL:
+            fleet.set_channel_all(value, kind)
+        elif operation == self.ADJUST_VOLUME_ALL:
+            fleet.adjust_volume_all(value, kind)
+        elif operation == self.CLAMP_VOLUMES:
+            fleet.clamp_volumes(int(value), self.indices[position], kind)
+        else:
+            raise ValueError(f"未知的日志操作码: {operation}")
+
+
+# 语音命令匹配
+class VoiceCommandMatcher:
+    """语音命令匹配器 - 一次扫描命令文本，找出优先级最高的短语
+
+    phrases 为按优先级从高到低排列的 (短语元组, 动作名) 序列。所有短语按前缀树
+    编译为一个正则表达式，用零宽前瞻在每个位置匹配从该位置开始的最长短语；
+    某位置出现的短语都是该最长短语的前缀，因此预先为每个短语记录
+    "它及其前缀短语中优先级最高的规则"，扫描结果取最小值即可，与按优先级逐条检查的结果相同。
+    扫描耗时与短语数量基本无关；语音命令大量重复，cache=True 时匹配结果按 (短语表, 命令)
+    缓存在模块级的 LRU 缓存中，短语表相同的匹配器共享缓存。
+    """
+    
+    def __init__(self, phrases, cache=True):
+        self.phrases = _PhraseTable((tuple(keywords), action) for keywords, action in phrases)
+        rules = {}  # 短语 -> (优先级, 动作名, 短语)
+        for priority, (keywords, action) in enumerate(self.phrases):
+            for keyword in keywords:
+                rules.setdefault(keyword, (priority, action, keyword))
+        self._best = {
+            keyword: min(rule for prefix, rule in rules.items() if keyword.startswith(prefix))
+            for keyword in rules
+        }
+        self._findall = re.compile(f"(?=({_trie_pattern(rules)}))").findall
+        self._cache = cache
+    
+    def match(self, command):
+        """返回 (动作名, 命中的短语)，没有匹配时返回 (None, None)"""
+        if self._cache:
+            return _match_voice_command(self.phrases, command)
+        return self._match(command)
+    
+    def _match(self, command):
+        found = self._findall(command)
+        if not found:
+            return None, None
+        _, action, keyword = min(map(self._best.__getitem__, found))
+        return action, keyword
+
+
+def _trie_pattern(words):
+    """把短语集合编译为前缀树形式的正则表达式，每一层只按下一个字符分支，优先匹配更长的短语"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        body = "|".join(branches)
+        if "" in node:
+            return f"(?:{body})?"
+        return body if len(branches) == 1 else f"(?:{body})"
+    
+    return emit(trie)
+
+
+class _PhraseTable(tuple):
+    """短语表 - 缓存了哈希值的元组，作为缓存键时不必每次重新计算整张表的哈希"""
+    
+    def __new__(cls, phrases):
+        table = super().__new__(cls, phrases)
+        table._hash = tuple.__hash__(table)
+        return table
+    
+    def __hash__(self):
+        return self._hash
+
+
+@lru_cache(maxsize=64)
+def _voice_matcher(phrases):
+    return VoiceCommandMatcher(phrases)
+
+
+@lru_cache(maxsize=65536)
+def _match_voice_command(phrases, command):
+    """按 (短语表, 命令) 缓存的匹配结果"""
+    return _voice_matcher(phrases)._match(command)
+
+
 # 抽象部分接口
 class RemoteControl:
-    """遥控器 - 抽象部分"""
+    """遥控器 - 抽象部分
+
+    在 batch() 块中的操作先在本地合并，块结束时对设备只做一次刷新：
+    设备状态只在第一次需要时读取，最终状态与逐次调用相同，
+    但相互抵消的操作（如连续两次开关机）不会产生任何设备调用。
+    """
     
     def __init__(self, device):
         self.device = device
+        self._batch = None
     
-    def toggle_power(self):
-        if self.device.is_enabled():
+    @contextmanager
+    def batch(self):
+        """批量模式，块结束时把合并后的操作应用到设备；嵌套使用时由最外层刷新"""
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = _PendingDeviceState(self.device)
+        try:
+            yield self
+        finally:
+            pending, self._batch = self._batch, None
+            pending.flush()
+    
+    def _set_power(self, enabled):
+        if self._batch is not None:
+            self._batch.enabled = enabled
+        elif enabled:
+            self.device.enable()
+        else:
             self.device.disable()
+    
+    def _set_volume(self, percent):
+        if self._batch is not None:
+            self._batch.set_volume(percent)
         else:
-            self.device.enable()
+            self.device.set_volume(percent)
+    
+    def _set_channel(self, channel):
+        if self._batch is not None:
+            self._batch.channel = channel
+        else:
+            self.device.set_channel(channel)
+    
+    def _is_enabled(self):
+        return self._batch.is_enabled() if self._batch is not None else self.device.is_enabled()
+    
+    def _get_volume(self):
+        return self._batch.get_volume() if self._batch is not None else self.device.get_volume()
+    
+    def _get_channel(self):
+        return self._batch.get_channel() if self._batch is not None else self.device.get_channel()
+    
+    def toggle_power(self):
+        self._set_power(not self._is_enabled())
     
     def volume_up(self):
-        self.device.set_volume(self.device.get_volume() + 10)
+        self._set_volume(self._get_volume() + 10)
     
     def volume_down(self):
-        self.device.set_volume(self.device.get_volume() - 10)
+        self._set_volume(self._get_volume() - 10)
     
     def channel_up(self):
-        self.device.set_channel(self.device.get_channel() + 1)
+        self._set_channel(self._get_channel() + 1)
     
     def channel_down(self):
-        self.device.set_channel(self.device.get_channel() - 1)
+        self._set_channel(self._get_channel() - 1)
+
+
+class _PendingDeviceState:
+    """批量模式下设备的本地状态副本 - 各项状态在首次读取时才从设备获取"""
+    
+    __slots__ = ("device", "enabled", "volume", "channel",
+                 "_initial_enabled", "_initial_volume", "_initial_channel")
+    
+    _UNKNOWN = object()
+    
+    def __init__(self, device):
+        self.device = device
+        self.enabled = self.volume = self.channel = self._UNKNOWN
+        self._initial_enabled = self._initial_volume = self._initial_channel = self._UNKNOWN
+    
+    def is_enabled(self):
+        if self.enabled is self._UNKNOWN:
+            self.enabled = self._initial_enabled = self.device.is_enabled()
+        return self.enabled
+    
+    def get_volume(self):
+        if self.volume is self._UNKNOWN:
+            self.volume = self._initial_volume = self.device.get_volume()
+        return self.volume
+    
+    def get_channel(self):
+        if self.channel is self._UNKNOWN:
+            self.channel = self._initial_channel = self.device.get_channel()
+        return self.channel
+    
+    def set_volume(self, percent):
+        volume_range = getattr(self.device, "VOLUME_RANGE", None)
+        if volume_range is not None:
+            percent = min(max(percent, volume_range[0]), volume_range[1])
+        self.volume = percent
+    
+    def flush(self):
+        """只对最终状态与初始状态不同（或初始状态未读取过）的项调用设备"""
+        unknown = self._UNKNOWN
+        if self.enabled is not unknown and self.enabled != self._initial_enabled:
+            if self.enabled:
+                self.device.enable()
+            else:
+                self.device.disable()
+        if self.volume is not unknown and self.volume != self._initial_volume:
+            self.device.set_volume(self.volume)
+        if self.channel is not unknown and self.channel != self._initial_channel:
+            self.device.set_channel(self.channel)
 
 
 # 扩展的抽象
@@ -165,42 +827,174 @@ class AdvancedRemoteControl(RemoteControl):
     """高级遥控器 - 扩展的抽象"""
     
     def mute(self):
-        self.device.set_volume(0)
+        self._set_volume(0)
         print("静音")
     
     def set_channel_direct(self, channel):
-        self.device.set_channel(channel)
+        self._set_channel(channel)
 
 
 class VoiceRemoteControl(RemoteControl):
-    """语音遥控器 - 另一种扩展的抽象"""
+    """语音遥控器 - 另一种扩展的抽象
+
+    phrases 为按优先级排列的 (短语元组, 动作名) 短语表，可以替换或扩展 DEFAULT_PHRASES；
+    动作名必须是 ACTIONS 中的一项。
+    """
+    
+    DEFAULT_PHRASES = (
+        (("开机", "打开"), "power_on"),
+        (("关机", "关闭"), "power_off"),
+        (("增大音量", "音量大"), "volume_up"),
+        (("减小音量", "音量小"), "volume_down"),
+        (("静音",), "mute"),
+        (("下一个", "频道增加"), "channel_up"),
+        (("上一个", "频道减少"), "channel_down"),
+        (("频道",), "set_channel"),
+    )
+    
+    ACTIONS = {"power_on", "power_off", "volume_up", "volume_down", "mute",
+               "channel_up", "channel_down", "set_channel"}
+    
+    def __init__(self, device, phrases=None):
+        super().__init__(device)
+        phrases = self.DEFAULT_PHRASES if phrases is None else tuple(
+            (tuple(keywords), action) for keywords, action in phrases
+        )
+        unknown = {action for _, action in phrases} - self.ACTIONS
+        if unknown:
+            raise ValueError(f"不支持的语音动作: {', '.join(sorted(unknown))}")
+        self.matcher = _voice_matcher(phrases)
     
     def process_voice_command(self, command):
+        """执行一条语音命令，返回执行的动作名，无法识别时返回 None"""
         print(f"接收到语音命令: '{command}'")
-        
-        if "开机" in command or "打开" in command:
-            self.device.enable()
-        elif "关机" in command or "关闭" in command:
-            self.device.disable()
-        elif "增大音量" in command or "音量大" in command:
-            self.volume_up()
-        elif "减小音量" in command or "音量小" in command:
-            self.volume_down()
-        elif "静音" in command:
-            self.device.set_volume(0)
-        elif "下一个" in command or "频道增加" in command:
-            self.channel_up()
-        elif "上一个" in command or "频道减少" in command:
-            self.channel_down()
-        elif "频道" in command:
-            # 解析命令中的频道号
+        action, keyword = self.matcher.match(command)
+        if action is None:
+            print("无法识别的命令")
+            return None
+        if not self._run_voice_action(action, command, keyword):
+            print("无法识别频道号")
+            return None
+        return action
+    
+    def process_voice_commands(self, commands):
+        """在批量模式下依次执行多条语音命令，不输出提示信息，按顺序返回每条命令执行的动作名"""
+        match = self.matcher.match
+        results = []
+        with self.batch():
+            for command in commands:
+                action, keyword = match(command)
+                if action is not None and not self._run_voice_action(action, command, keyword):
+                    action = None
+                results.append(action)
+        return results
+    
+    def _run_voice_action(self, action, command, keyword):
+        """执行动作，频道号无法解析时返回 False"""
+        if action == "set_channel":
+            # 解析命令中短语之后的频道号
             try:
-                channel = float(command.split("频道")[1].strip())
-                self.device.set_channel(channel)
-            except:
-                print("无法识别频道号")
+                channel = float(command.split(keyword)[1].strip())
+            except ValueError:
+                return False
+            self._set_channel(channel)
+        elif action == "power_on":
+            self._set_power(True)
+        elif action == "power_off":
+            self._set_power(False)
+        elif action == "mute":
+            self._set_volume(0)
         else:
-            print("无法识别的命令")
+            getattr(self, action)()
+        return True
+
+
+# 异步的抽象 - 同时控制多台网络设备
+class AsyncRemoteControl:
+    """异步遥控器 - 把一个命令同时发送给 devices 中的所有设备
+
+    每个命令返回按设备顺序排列的结果列表：成功为 None，失败为对应的异常
+    （超时为 TimeoutError），一台设备出错不影响其他设备。
+    发往同一台设备的命令严格按提交顺序执行；每台设备上的单个命令最多执行 timeout 秒，
+    max_concurrency 限制同时在执行的设备命令数（None 表示不限制）。
+    """
+    
+    def __init__(self, devices, timeout=1.0, max_concurrency=None):
+        self.devices = list(devices)
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._tails = {}  # id(设备) -> 该设备上最后提交的命令
+    
+    async def broadcast(self, operation):
+        """对所有设备执行 operation(device) 协程函数"""
+        return await asyncio.gather(*(self.submit(device, operation) for device in self.devices))
+    
+    def submit(self, device, operation):
+        """向单台设备提交命令，返回在该设备之前的命令完成后才开始执行的任务"""
+        key = id(device)
+        previous = self._tails.get(key)
+        task = asyncio.ensure_future(self._run_after(previous, device, operation))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._tails.get(key) is done and self._tails.pop(key))
+        return task
+    
+    async def _run_after(self, previous, device, operation):
+        if previous is not None:
+            await asyncio.wait((previous,))
+        try:
+            if self._semaphore is None:
+                await asyncio.wait_for(operation(device), self.timeout)
+            else:
+                async with self._semaphore:
+                    await asyncio.wait_for(operation(device), self.timeout)
+        except asyncio.TimeoutError as error:
+            # Python 3.11 之前 asyncio.TimeoutError 与内置的 TimeoutError 是不同的类
+            return error if isinstance(error, TimeoutError) else TimeoutError(*error.args)
+        except Exception as error:
+            return error
+        return None
+    
+    async def toggle_power(self):
+        return await self.broadcast(_async_toggle_power)
+    
+    async def power_on(self):
+        return await self.broadcast(lambda device: device.enable())
+    
+    async def power_off(self):
+        return await self.broadcast(lambda device: device.disable())
+    
+    async def volume_up(self):
+        return await self.broadcast(lambda device: _async_adjust_volume(device, 10))
+    
+    async def volume_down(self):
+        return await self.broadcast(lambda device: _async_adjust_volume(device, -10))
+    
+    async def mute(self):
+        return await self.broadcast(lambda device: device.set_volume(0))
+    
+    async def channel_up(self):
+        return await self.broadcast(lambda device: _async_adjust_channel(device, 1))
+    
+    async def channel_down(self):
+        return await self.broadcast(lambda device: _async_adjust_channel(device, -1))
+    
+    async def set_channel(self, channel):
+        return await self.broadcast(lambda device: device.set_channel(channel))
+
+
+async def _async_toggle_power(device):
+    if await device.is_enabled():
+        await device.disable()
+    else:
+        await device.enable()
+
+
+async def _async_adjust_volume(device, delta):
+    await device.set_volume(await device.get_volume() + delta)
+
+
+async def _async_adjust_channel(device, delta):
+    await device.set_channel(await device.get_channel() + delta)
 
 
 # 客户端代码
@@ -238,6 +1032,12 @@ if __name__ == "__main__":
     voice_remote.process_voice_command("频道 5")
     voice_remote.process_voice_command("关闭电视")
     
+    # 自定义短语表，并批量处理一串语音命令
+    phrases = VoiceRemoteControl.DEFAULT_PHRASES + ((("大声点",), "volume_up"), (("换台",), "channel_up"))
+    voice_remote = VoiceRemoteControl(tv, phrases)
+    actions = voice_remote.process_voice_commands(["打开电视", "大声点", "大声点", "换台", "频道 八", "今天天气怎么样"])
+    print(f"批量执行的动作: {actions}")
+    
     print("\n" + "-" * 50 + "\n")
     
     # 演示桥接模式的灵活性 - 在运行时切换设备
@@ -262,3 +1062,74 @@ if __name__ == "__main__":
     remote.toggle_power()
     remote.set_channel_direct(98.5)
     remote.mute()
+    
+    print("\n" + "-" * 50 + "\n")
+    
+    # 批量模式 - 一连串按键事件合并为一次设备刷新
+    print("批量模式 - 合并一连串按键事件:")
+    tv = Television()
+    remote = AdvancedRemoteControl(tv)
+    with remote.batch():
+        for _ in range(10):
+            remote.volume_up()    # 连续增大音量，只在结束时设置一次
+        remote.toggle_power()
+        remote.toggle_power()     # 开关机相互抵消，不调用设备
+        remote.channel_up()
+        remote.channel_up()
+        remote.channel_down()
+    print(f"最终状态: 开机={tv.is_enabled()}, 音量={tv.get_volume()}, 频道={tv.get_channel()}")
+    
+    print("\n" + "-" * 50 + "\n")
+    
+    # 大规模设备集合 - 列式存储，批量操作整列数据
+    print("设备集合 - 同时管理大量设备:")
+    fleet = DeviceFleet()
+    fleet.add(DeviceFleet.TELEVISION, 1000)
+    radios = fleet.add(DeviceFleet.RADIO, 1000)
+    fleet.enable_all()
+    fleet.mute_all(DeviceFleet.RADIO)       # 只静音收音机
+    remote = AdvancedRemoteControl(fleet[0])  # 单台设备的视图可以交给遥控器
+    remote.volume_up()
+    print(f"开机 {fleet.count_enabled()} 台, 第一台电视音量 {fleet[0].get_volume()}, "
+          f"第一台收音机音量 {fleet[radios[0]].get_volume()}")
+    
+    print("\n" + "-" * 50 + "\n")
+    
+    # 异步遥控器 - 同时控制一个房间里的多台网络设备
+    print("异步遥控器 - 同时控制多台网络设备:")
+    
+    async def async_demo():
+        room = [SimulatedNetworkDevice(Television(), latency=0.05), SimulatedNetworkDevice(Radio(), latency=0.05),
+                SimulatedNetworkDevice(Television(), latency=0.5)]  # 最后一台设备响应很慢
+        async_remote = AsyncRemoteControl(room, timeout=0.2)
+        results = await async_remote.power_on()
+        print(f"开机结果: {['成功' if error is None else type(error).__name__ for error in results]}")
+        # 不等待前一个命令完成就提交下一个，每台设备上仍按提交顺序执行
+        await asyncio.gather(async_remote.volume_up(), async_remote.mute(), async_remote.volume_up())
+    
+    asyncio.run(async_demo())
+    
+    print("\n" + "-" * 50 + "\n")
+    
+    # 快照与变化日志 - 保存设备集合的检查点，之后的变化记录到日志中
+    print("快照与变化日志 - 检查点和恢复:")
+    fleet = DeviceFleet(DeviceJournal())
+    fleet.add(DeviceFleet.TELEVISION, 1000)
+    radios = fleet.add(DeviceFleet.RADIO, 1000)
+    checkpoint = fleet.checkpoint()
+    fleet.enable_all(DeviceFleet.RADIO)
+    fleet[0].enable()
+    fleet[0].set_channel(7)
+    AdvancedRemoteControl(fleet[radios[0]]).set_channel_direct(101.1)
+    fleet.adjust_volume_all(25)
+    log = fleet.journal.to_bytes()
+    print(f"快照 {len(checkpoint)} 字节, 日志 {len(fleet.journal)} 条记录 {len(log)} 字节")
+    
+    restored = DeviceFleet.from_snapshot(checkpoint)
+    DeviceJournal.from_bytes(log).replay(restored)
+    print(f"恢复后状态一致: {restored.snapshot() == fleet.snapshot()}, "
+          f"第一台电视: 开机={restored[0].is_enabled()}, 音量={restored[0].get_volume()}, 频道={restored[0].get_channel()}")
+    
+    # 普通的 Television / Radio 对象也可以经由设备集合保存和恢复
+    devices = DeviceFleet.from_snapshot(DeviceFleet.from_devices([tv, radio]).snapshot()).to_devices()
+    print(f"恢复的设备: {[(type(device).__name__, device.get_volume(), device.get_channel()) for device in devices]}")
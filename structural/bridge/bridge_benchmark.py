@@ -0,0 +1,355 @@
+"""
+桥接模式性能测试
+
+在本目录下运行: python bridge_benchmark.py
+"""
+
+import asyncio
+import contextlib
+import io
+import pickle
+import random
+import time
+import tracemalloc
+
+from bridge import (
+    Television, AdvancedRemoteControl, DeviceFleet, VoiceRemoteControl, VoiceCommandMatcher,
+    AsyncRemoteControl, SimulatedNetworkDevice, DeviceJournal,
+)
+
+
+class CountingTelevision(Television):
+    """记录设备调用次数的电视"""
+    
+    calls = 0
+    
+    def is_enabled(self):
+        CountingTelevision.calls += 1
+        return super().is_enabled()
+    
+    def enable(self):
+        CountingTelevision.calls += 1
+        super().enable()
+    
+    def disable(self):
+        CountingTelevision.calls += 1
+        super().disable()
+    
+    def get_volume(self):
+        CountingTelevision.calls += 1
+        return super().get_volume()
+    
+    def set_volume(self, percent):
+        CountingTelevision.calls += 1
+        super().set_volume(percent)
+    
+    def get_channel(self):
+        CountingTelevision.calls += 1
+        return super().get_channel()
+    
+    def set_channel(self, channel):
+        CountingTelevision.calls += 1
+        super().set_channel(channel)
+
+
+BURST_OPERATIONS = ("volume_up", "volume_up", "volume_down", "channel_up", "channel_down",
+                    "toggle_power", "mute")
+
+
+def benchmark_batching(devices=1000, burst=30, seed=0):
+    """比较逐次调用与批量模式处理 devices 台设备各 burst 个按键事件的耗时（秒）和设备调用次数"""
+    rng = random.Random(seed)
+    bursts = [[rng.choice(BURST_OPERATIONS) for _ in range(burst)] for _ in range(devices)]
+    results = {}
+    for mode in ("immediate", "batched"):
+        remotes = [AdvancedRemoteControl(CountingTelevision()) for _ in range(devices)]
+        CountingTelevision.calls = 0
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            start = time.perf_counter()
+            for remote, operations in zip(remotes, bursts):
+                if mode == "batched":
+                    with remote.batch():
+                        for operation in operations:
+                            getattr(remote, operation)()
+                else:
+                    for operation in operations:
+                        getattr(remote, operation)()
+            elapsed = time.perf_counter() - start
+        results[mode] = {"seconds": elapsed, "device_calls": CountingTelevision.calls,
+                         "output_lines": output.getvalue().count("\n"),
+                         "final_state": [(r.device._enabled, r.device._volume, r.device._channel) for r in remotes]}
+    assert results["immediate"]["final_state"] == results["batched"]["final_state"]
+    for result in results.values():
+        del result["final_state"]
+    return results
+
+
+def benchmark_fleet(devices=1_000_000):
+    """比较 devices 个 Television 对象的列表与 DeviceFleet 的内存占用（字节）和批量操作耗时（秒）"""
+    results = {}
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    televisions = [Television() for _ in range(devices)]
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    timings = {"build": build}
+    start = time.perf_counter()
+    for television in televisions:
+        television._volume = 0
+    timings["mute_all"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for television in televisions:
+        television._volume = min(max(television._volume + 15, 10), 80)
+    timings["adjust_and_clamp"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for index, television in enumerate(televisions):
+        if index % 2:
+            television._enabled = True
+    timings["enable_half"] = time.perf_counter() - start
+    results["objects"] = {"bytes": memory, **timings}
+    del televisions
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    fleet = DeviceFleet()
+    fleet.add(DeviceFleet.TELEVISION, devices)
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    timings = {"build": build}
+    start = time.perf_counter()
+    fleet.mute_all()
+    timings["mute_all"] = time.perf_counter() - start
+    start = time.perf_counter()
+    fleet.adjust_volume_all(15)
+    fleet.clamp_volumes(10, 80)
+    timings["adjust_and_clamp"] = time.perf_counter() - start
+    results["fleet"] = {"bytes": memory, **timings}
+    
+    # 一半电视一半收音机，按类型的操作逐元素选择
+    mixed = DeviceFleet()
+    mixed.add(DeviceFleet.TELEVISION, devices // 2)
+    radios = mixed.add(DeviceFleet.RADIO, devices // 2)
+    start = time.perf_counter()
+    mixed.enable_all(DeviceFleet.RADIO)
+    results["fleet"]["enable_half"] = time.perf_counter() - start
+    start = time.perf_counter()
+    mixed.mute_all(DeviceFleet.RADIO)
+    results["fleet"]["mute_radios"] = time.perf_counter() - start
+    start = time.perf_counter()
+    mixed.set_channel_all(101.1, DeviceFleet.RADIO)
+    results["fleet"]["tune_radios"] = time.perf_counter() - start
+    assert mixed.count_enabled() == devices // 2 and mixed[radios[0]].get_channel() == 101.1 and mixed[0].get_channel() == 1
+    return results
+
+
+class LegacyVoiceRemoteControl(AdvancedRemoteControl):
+    """原 VoiceRemoteControl 的实现：按优先级逐条做子串检查"""
+    
+    def process_voice_command(self, command):
+        print(f"接收到语音命令: '{command}'")
+        
+        if "开机" in command or "打开" in command:
+            self.device.enable()
+        elif "关机" in command or "关闭" in command:
+            self.device.disable()
+        elif "增大音量" in command or "音量大" in command:
+            self.volume_up()
+        elif "减小音量" in command or "音量小" in command:
+            self.volume_down()
+        elif "静音" in command:
+            self.device.set_volume(0)
+        elif "下一个" in command or "频道增加" in command:
+            self.channel_up()
+        elif "上一个" in command or "频道减少" in command:
+            self.channel_down()
+        elif "频道" in command:
+            try:
+                channel = float(command.split("频道")[1].strip())
+                self.device.set_channel(channel)
+            except:
+                print("无法识别频道号")
+        else:
+            print("无法识别的命令")
+
+
+VOICE_TEMPLATES = ("打开电视", "请把电视打开", "关闭电视", "增大音量", "音量大一点", "减小音量", "音量小一点",
+                   "静音", "下一个频道", "频道增加", "上一个", "频道减少", "频道 {}", "切到频道 {}", "今天天气怎么样")
+
+
+def synthetic_voice_commands(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(VOICE_TEMPLATES).format(rng.randint(1, 200)) for _ in range(count)]
+
+
+def benchmark_voice_commands(count=1_000_000, large_table_rules=200, match_count=200_000):
+    """比较原实现与新实现处理 count 条语音命令的耗时（秒），以及大短语表下单纯匹配的耗时"""
+    commands = synthetic_voice_commands(count)
+    results = {}
+    
+    legacy_tv, tv = Television(), Television()
+    legacy_remote, remote = LegacyVoiceRemoteControl(legacy_tv), VoiceRemoteControl(tv)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for command in commands:
+            legacy_remote.process_voice_command(command)
+        results["legacy_per_command"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        for command in commands:
+            remote.process_voice_command(command)
+        results["matcher_per_command"] = time.perf_counter() - start
+    
+    tv = Television()
+    remote = VoiceRemoteControl(tv)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        remote.process_voice_commands(commands)
+        results["matcher_batch"] = time.perf_counter() - start
+    assert (tv._enabled, tv._volume, tv._channel) == (legacy_tv._enabled, legacy_tv._volume, legacy_tv._channel)
+    
+    # 大短语表：在默认短语表后追加 large_table_rules 条规则，命令都是唯一的，缓存不起作用
+    phrases = VoiceRemoteControl.DEFAULT_PHRASES + tuple(
+        ((f"场景{i}甲", f"场景{i}乙"), "mute") for i in range(large_table_rules)
+    )
+    unique_commands = [f"{command} #{i}" for i, command in enumerate(commands[:match_count])]
+    start = time.perf_counter()
+    for command in unique_commands:
+        for keywords, action in phrases:
+            if any(keyword in command for keyword in keywords):
+                break
+    results[f"linear_{len(phrases)}_rules"] = time.perf_counter() - start
+    match = VoiceCommandMatcher(phrases, cache=False).match
+    start = time.perf_counter()
+    for command in unique_commands:
+        match(command)
+    results[f"matcher_{len(phrases)}_rules"] = time.perf_counter() - start
+    return results
+
+
+def benchmark_async_broadcast(room_sizes=(10, 100, 1000), commands=5, latency=0.01, sequential_limit=100):
+    """比较逐台设备依次执行与同时发送时，一个房间的设备执行 commands 个命令的耗时（秒），网络延迟 latency 秒
+
+    依次执行的耗时与设备数成正比，超过 sequential_limit 台时不测。
+    """
+    results = {}
+    for size in room_sizes:
+        timings = {"sequential": None}
+        for mode in ("sequential", "concurrent") if size <= sequential_limit else ("concurrent",):
+            televisions = [Television() for _ in range(size)]
+            remote = AsyncRemoteControl([SimulatedNetworkDevice(tv, latency) for tv in televisions], timeout=5.0)
+            
+            async def run():
+                for _ in range(commands):
+                    if mode == "concurrent":
+                        await remote.volume_up()
+                    else:
+                        for device in remote.devices:
+                            await device.set_volume(await device.get_volume() + 10)
+            
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                asyncio.run(run())
+                timings[mode] = time.perf_counter() - start
+            assert all(tv.get_volume() == 80 for tv in televisions)
+        results[size] = timings
+    return results
+
+
+def benchmark_snapshot(devices=1_000_000, writes=1_000_000, seed=0):
+    """比较保存和恢复 devices 台设备、回放 writes 条单台设备写操作的耗时（秒）与数据大小（字节）
+
+    对照组为 pickle 保存的 Television / Radio 对象列表，以及按记录逐条调用设备方法的回放。
+    """
+    results = {}
+    fleet = DeviceFleet()
+    fleet.add(DeviceFleet.TELEVISION, devices // 2)
+    fleet.add(DeviceFleet.RADIO, devices - devices // 2)
+    
+    objects = fleet.to_devices()
+    start = time.perf_counter()
+    data = pickle.dumps(objects, pickle.HIGHEST_PROTOCOL)
+    save = time.perf_counter() - start
+    del objects
+    start = time.perf_counter()
+    pickle.loads(data)
+    results["pickle_objects"] = {"bytes": len(data), "save": save, "restore": time.perf_counter() - start}
+    
+    start = time.perf_counter()
+    data = fleet.snapshot()
+    save = time.perf_counter() - start
+    start = time.perf_counter()
+    restored = DeviceFleet.from_snapshot(data)
+    results["fleet_snapshot"] = {"bytes": len(data), "save": save, "restore": time.perf_counter() - start}
+    assert restored.snapshot() == data
+    
+    # 随机的单台设备写操作，中间穿插少量批量操作
+    rng = random.Random(seed)
+    fleet.journal = DeviceJournal()
+    for step in range(writes):
+        device = fleet[rng.randrange(devices)]
+        operation = rng.randrange(4)
+        if operation == 0:
+            device.enable()
+        elif operation == 1:
+            device.disable()
+        elif operation == 2:
+            device.set_volume(rng.randrange(101))
+        else:
+            device.set_channel(rng.randrange(1, 200))
+        if step % (writes // 4) == 0:
+            fleet.adjust_volume_all(-5, DeviceFleet.RADIO)
+    log = fleet.journal.to_bytes()
+    
+    # 逐条回放：按记录调用单台设备的方法
+    journal = DeviceJournal.from_bytes(log)
+    naive = DeviceFleet.from_snapshot(data)
+    start = time.perf_counter()
+    for position, (operation, index, value) in enumerate(zip(journal.operations, journal.indices, journal.values)):
+        if operation == DeviceJournal.ENABLE:
+            naive[index].enable()
+        elif operation == DeviceJournal.DISABLE:
+            naive[index].disable()
+        elif operation == DeviceJournal.SET_VOLUME:
+            naive[index].set_volume(value)
+        elif operation == DeviceJournal.SET_CHANNEL:
+            naive[index].set_channel(value)
+        else:
+            journal._replay_bulk(naive, position)
+    results["replay_per_record"] = {"bytes": len(log), "restore": time.perf_counter() - start}
+    
+    start = time.perf_counter()
+    journal = DeviceJournal.from_bytes(log)
+    restored = DeviceFleet.from_snapshot(data)
+    journal.replay(restored)
+    results["replay_journal"] = {"bytes": len(log), "restore": time.perf_counter() - start}
+    assert restored.snapshot() == naive.snapshot() == fleet.snapshot()
+    return results
+
+
+if __name__ == "__main__":
+    print("=== 遥控器批量模式 (1000 台电视, 每台 30 个按键事件) ===")
+    for mode, result in benchmark_batching().items():
+        print(f"{mode:<10} {result['seconds']:8.3f} 秒  设备调用 {result['device_calls']:>7,}  "
+              f"输出 {result['output_lines']:>7,} 行")
+    
+    print("\n=== 100 万台设备: Television 对象列表与 DeviceFleet ===")
+    for mode, result in benchmark_fleet().items():
+        timings = "  ".join(f"{name} {seconds * 1000:8.1f} 毫秒" for name, seconds in result.items() if name != "bytes")
+        print(f"{mode:<8} 内存 {result['bytes'] / 1e6:7.1f} MB  {timings}")
+    
+    print("\n=== 语音命令 (1000000 条, 秒) ===")
+    for mode, seconds in benchmark_voice_commands().items():
+        print(f"{mode:<22} {seconds:8.3f}")
+    
+    print("\n=== 异步遥控器: 每台设备 5 个命令, 网络延迟 10 毫秒 (秒) ===")
+    for size, timings in benchmark_async_broadcast().items():
+        sequential = "       -" if timings["sequential"] is None else f"{timings['sequential']:8.3f}"
+        print(f"{size:>6} 台设备  依次执行 {sequential}  同时发送 {timings['concurrent']:8.3f}")
+    
+    print("\n=== 快照与日志: 100 万台设备, 100 万条写操作 ===")
+    for mode, result in benchmark_snapshot().items():
+        save = f"保存 {result['save'] * 1000:8.1f} 毫秒  " if "save" in result else " " * 19
+        print(f"{mode:<18} {result['bytes'] / 1e6:7.1f} MB  {save}恢复 {result['restore'] * 1000:8.1f} 毫秒")
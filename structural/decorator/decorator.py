@@ -12,106 +12,271 @@
 可以动态地为文本添加各种格式化功能，如加粗、斜体、添加前缀等。
 """
 
+import copy
+import inspect
+import io
+import os
+import weakref
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from time import perf_counter
+
+
+# 当前存活的渲染缓存 id(缓存) -> 弱引用，组件属性变化时通知它们失效
+# 只有存在缓存时才在 TextComponent 上安装 __setattr__ 钩子，没有缓存时属性赋值没有额外开销
+_render_caches = {}
+
+
+def _notifying_setattr(component, name, value):
+    """存在渲染缓存时 TextComponent 的 __setattr__ - 赋值后通知所有缓存使节点失效"""
+    object.__setattr__(component, name, value)
+    for cache_ref in list(_render_caches.values()):
+        cache = cache_ref()
+        if cache is not None:
+            cache.invalidate(component)
+
+
+def _register_render_cache(cache):
+    key = id(cache)
+    
+    def unregister(_):
+        _render_caches.pop(key, None)
+        if not _render_caches and "__setattr__" in TextComponent.__dict__:
+            del TextComponent.__setattr__
+    
+    if not _render_caches:
+        TextComponent.__setattr__ = _notifying_setattr
+    _render_caches[key] = weakref.ref(cache, unregister)
 
 
 # 抽象组件接口
 class TextComponent(ABC):
     """文本组件接口 - 定义所有具体组件和装饰器的共同接口"""
     
+    __slots__ = ("__weakref__",)
+    
     @abstractmethod
     def get_text(self):
         """获取文本内容"""
         pass
+    
+    def get_texts(self, texts, block_size=1024):
+        """批量获取文本 - 用 texts 中的每个文本替换叶子文本后渲染
+
+        输入按块处理，每一层装饰器一次处理整块文本；结果惰性产出，
+        传入生成器时内存占用只与 block_size 有关。
+        """
+        iterator = iter(texts)
+        while True:
+            block = list(islice(iterator, block_size))
+            if not block:
+                return
+            yield from self._render_block(block)
+    
+    def _render_block(self, block):
+        """渲染一块文本，返回列表"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持批量渲染")
+    
+    def iter_chunks(self, chunk_size=65536):
+        """流式渲染 - 逐段产出渲染结果；默认实现一次产出完整文本"""
+        yield self.get_text()
+    
+    def write_to(self, sink, chunk_size=65536):
+        """将渲染结果逐段写入类文件对象 sink，返回写入的字符数"""
+        written = 0
+        for chunk in self.iter_chunks(chunk_size):
+            sink.write(chunk)
+            written += len(chunk)
+        return written
 
 
 # 具体组件
 class PlainText(TextComponent):
     """具体组件 - 基础文本，不包含任何格式"""
     
+    __slots__ = ("text",)
+    
     def __init__(self, text):
         self.text = text
     
     def get_text(self):
         return self.text
+    
+    def _render_block(self, block):
+        return block
+    
+    def iter_chunks(self, chunk_size=65536):
+        if len(self.text) <= chunk_size:
+            yield self.text
+            return
+        for start in range(0, len(self.text), chunk_size):
+            yield self.text[start:start + chunk_size]
 
 
 # 装饰器基类
 class TextDecorator(TextComponent):
     """装饰器基类 - 包含对组件的引用，并实现基础接口"""
     
+    __slots__ = ("_text_component",)
+    
+    # 大小写转换函数；仅大小写类装饰器设置，供编译渲染使用
+    _transform = None
+    
     def __init__(self, text_component):
         self._text_component = text_component
     
     @abstractmethod
     def get_text(self):
         pass
+    
+    def _fragments(self):
+        """返回包裹在内部文本前后的静态片段 (开头, 结尾)；非包裹型装饰器返回 None"""
+        return None
+    
+    def _decorate(self, text):
+        """对已渲染的内部文本应用本装饰器；自定义装饰器重写此方法可以让批量渲染不必逐个调用 get_text()"""
+        fragments = self._fragments()
+        if fragments is not None:
+            return f"{fragments[0]}{text}{fragments[1]}"
+        if self._transform is not None:
+            return self._transform(text)
+        raise NotImplementedError(f"{type(self).__name__} 未实现 _decorate")
+    
+    def _render_block(self, block):
+        texts = self._text_component._render_block(block)
+        fragments = self._fragments()
+        if fragments is not None:
+            prefix, suffix = fragments
+            return [f"{prefix}{text}{suffix}" for text in texts]
+        if self._transform is not None:
+            return list(map(self._transform, texts))
+        if type(self)._decorate is TextDecorator._decorate:
+            # 只重写了 get_text 的自定义装饰器：逐个文本在副本上换入内部组件后调用 get_text()
+            decorator = copy.copy(self)
+            rendered = []
+            for text in texts:
+                object.__setattr__(decorator, "_text_component", PlainText(text))
+                rendered.append(decorator.get_text())
+            return rendered
+        return [self._decorate(text) for text in texts]
+    
+    def iter_chunks(self, chunk_size=65536):
+        """流式渲染 - 包裹层在内部内容前后输出静态片段，大小写层逐段转换，正文不被整体复制"""
+        leaf, operations = _flatten(self)
+        if leaf is self:
+            yield self.get_text()
+            return
+        chunks = leaf.iter_chunks(chunk_size)
+        for operation in _normalize(operations):
+            if isinstance(operation, tuple):
+                chunks = _wrap_chunks(chunks, *operation)
+            else:
+                chunks = _transform_chunks(chunks, operation)
+        yield from chunks
 
 
 # 具体装饰器 - 加粗
 class BoldDecorator(TextDecorator):
     """具体装饰器 - 为文本添加加粗格式"""
     
+    __slots__ = ()
+    
     def get_text(self):
         return f"<b>{self._text_component.get_text()}</b>"
+    
+    def _fragments(self):
+        return "<b>", "</b>"
 
 
 # 具体装饰器 - 斜体
 class ItalicDecorator(TextDecorator):
     """具体装饰器 - 为文本添加斜体格式"""
     
+    __slots__ = ()
+    
     def get_text(self):
         return f"<i>{self._text_component.get_text()}</i>"
+    
+    def _fragments(self):
+        return "<i>", "</i>"
 
 
 # 具体装饰器 - 下划线
 class UnderlineDecorator(TextDecorator):
     """具体装饰器 - 为文本添加下划线格式"""
     
+    __slots__ = ()
+    
     def get_text(self):
         return f"<u>{self._text_component.get_text()}</u>"
+    
+    def _fragments(self):
+        return "<u>", "</u>"
 
 
 # 具体装饰器 - 颜色
 class ColorDecorator(TextDecorator):
     """具体装饰器 - 为文本添加颜色"""
     
+    __slots__ = ("color",)
+    
     def __init__(self, text_component, color):
         super().__init__(text_component)
         self.color = color
     
     def get_text(self):
         return f'<span style="color:{self.color}">{self._text_component.get_text()}</span>'
+    
+    def _fragments(self):
+        return f'<span style="color:{self.color}">', "</span>"
 
 
 # 具体装饰器 - 添加前缀
 class PrefixDecorator(TextDecorator):
     """具体装饰器 - 为文本添加前缀"""
     
+    __slots__ = ("prefix",)
+    
     def __init__(self, text_component, prefix):
         super().__init__(text_component)
         self.prefix = prefix
     
     def get_text(self):
         return f"{self.prefix} {self._text_component.get_text()}"
+    
+    def _fragments(self):
+        return f"{self.prefix} ", ""
 
 
 # 具体装饰器 - 添加后缀
 class SuffixDecorator(TextDecorator):
     """具体装饰器 - 为文本添加后缀"""
     
+    __slots__ = ("suffix",)
+    
     def __init__(self, text_component, suffix):
         super().__init__(text_component)
         self.suffix = suffix
     
     def get_text(self):
         return f"{self._text_component.get_text()} {self.suffix}"
+    
+    def _fragments(self):
+        return "", f" {self.suffix}"
 
 
 # 具体装饰器 - 转换为大写
 class UpperCaseDecorator(TextDecorator):
     """具体装饰器 - 将文本转换为大写"""
     
+    __slots__ = ()
+    
+    _transform = staticmethod(str.upper)
+    
     def get_text(self):
         return self._text_component.get_text().upper()
 
@@ -120,40 +285,565 @@ class UpperCaseDecorator(TextDecorator):
 class LowerCaseDecorator(TextDecorator):
     """具体装饰器 - 将文本转换为小写"""
     
+    __slots__ = ()
+    
+    _transform = staticmethod(str.lower)
+    
     def get_text(self):
         return self._text_component.get_text().lower()
 
 
+# 具体装饰器 - 静态模板
+class TemplateDecorator(TextDecorator):
+    """具体装饰器 - 用固定的前缀和后缀包裹文本，用于承载合并后的多层包裹装饰器"""
+    
+    __slots__ = ("prefix", "suffix")
+    
+    def __init__(self, text_component, prefix, suffix):
+        super().__init__(text_component)
+        self.prefix = prefix
+        self.suffix = suffix
+    
+    def get_text(self):
+        return f"{self.prefix}{self._text_component.get_text()}{self.suffix}"
+    
+    def _fragments(self):
+        return self.prefix, self.suffix
+
+
+_CASE_DECORATORS = {
+    str.upper: UpperCaseDecorator,
+    str.lower: LowerCaseDecorator,
+}
+
+
+# 渲染缓存
+class TextRenderCache:
+    """渲染缓存 - 按节点缓存 get_text() 的结果（可选启用）
+
+    共享子树只渲染一次；任意节点的属性（文本、颜色、前缀、内部组件等）被修改时，
+    该节点及所有经由本缓存渲染过的上层节点自动失效。缓存按 LRU 淘汰，
+    淘汰某个节点时它的上层节点也一并移除。
+    """
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # id(节点) -> (节点, 文本)
+        self._parents = {}  # id(子节点) -> {id(父节点)}
+        _register_render_cache(self)
+    
+    def get_text(self, text_component):
+        """获取文本内容，优先使用缓存"""
+        key = id(text_component)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+        
+        self.misses += 1
+        if isinstance(text_component, TextDecorator):
+            inner = text_component._text_component
+            inner_text = self.get_text(inner)
+            try:
+                text = text_component._decorate(inner_text)
+            except NotImplementedError:
+                text = text_component.get_text()
+            if id(inner) not in self._entries:
+                # 内部节点在渲染过程中已被淘汰，无法再收到它的失效通知，本节点不缓存
+                return text
+            self._parents.setdefault(id(inner), set()).add(key)
+        else:
+            text = text_component.get_text()
+        
+        self._entries[key] = (text_component, text)
+        if len(self._entries) > self.maxsize:
+            # 淘汰的节点连同其上层节点一起移除，否则上层节点与叶子之间的失效链会断开
+            self._evict(next(iter(self._entries)))
+        return text
+    
+    def invalidate(self, text_component):
+        """使节点及依赖它的上层节点失效"""
+        self._evict(id(text_component))
+    
+    def _evict(self, key):
+        pending = [key]
+        while pending:
+            key = pending.pop()
+            self._discard(key)
+            pending.extend(self._parents.pop(key, ()))
+    
+    def clear(self):
+        """清空缓存和计数"""
+        self._entries.clear()
+        self._parents.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None or not isinstance(entry[0], TextDecorator):
+            return
+        inner_key = id(entry[0]._text_component)
+        parents = self._parents.get(inner_key)
+        if parents is not None:
+            parents.discard(key)
+            if not parents:
+                del self._parents[inner_key]
+
+
+# 渲染耗时统计
+class RenderProfiler:
+    """渲染耗时统计 - 按组件类统计 get_text() 的调用次数和自身耗时（可选启用）
+
+    在 with 块内临时替换各组件类的 get_text，退出时恢复；未启用时没有任何额外开销。
+    自身耗时不包含内部组件的渲染时间，可以看出哪一层装饰器占用了主要时间。
+    只统计递归的 get_text() 路径。
+    """
+    
+    def __init__(self):
+        self.calls = {}
+        self.self_time = {}
+        self._originals = {}
+        self._stack = []
+    
+    def __enter__(self):
+        pending = [TextComponent]
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            if "get_text" in cls.__dict__ and not getattr(cls.get_text, "__isabstractmethod__", False):
+                self._originals[cls] = cls.__dict__["get_text"]
+                cls.get_text = self._timed(cls, cls.__dict__["get_text"])
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        for cls, get_text in self._originals.items():
+            cls.get_text = get_text
+        self._originals.clear()
+    
+    def _timed(self, cls, get_text):
+        name = cls.__name__
+        stack = self._stack
+        
+        def timed_get_text(component):
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                return get_text(component)
+            finally:
+                elapsed = perf_counter() - start
+                inner = stack.pop()
+                self.calls[name] = self.calls.get(name, 0) + 1
+                self.self_time[name] = self.self_time.get(name, 0.0) + elapsed - inner
+                if stack:
+                    stack[-1] += elapsed
+        
+        return timed_get_text
+    
+    def report(self):
+        """按自身耗时从高到低返回 [(类名, 调用次数, 自身耗时秒数)]"""
+        return sorted(
+            ((name, self.calls[name], seconds) for name, seconds in self.self_time.items()),
+            key=lambda row: row[2],
+            reverse=True,
+        )
+
+
+def _flatten(text_component):
+    """将装饰器链展开为 (叶子组件, 操作列表)，操作按从内到外的顺序排列
+
+    包裹型装饰器展开为 (开头, 结尾) 片段，大小写装饰器展开为转换函数；
+    遇到无法展开的自定义装饰器时停止，将其视为叶子。
+    """
+    operations = []
+    node = text_component
+    while isinstance(node, TextDecorator):
+        fragments = node._fragments()
+        if fragments is not None:
+            operations.append(fragments)
+        elif node._transform is not None:
+            operations.append(node._transform)
+        else:
+            break
+        node = node._text_component
+    operations.reverse()
+    return node, operations
+
+
+def _normalize(operations, exact=True):
+    """化简操作列表：合并相邻的包裹片段，去掉被后续大小写转换覆盖的转换
+
+    exact=True 时只做对任意文本都逐字节等价的化简：
+    - 大写是逐字符映射且幂等，后面还有大写时可去掉前面的大写；
+    - 小写带有希腊字母 Σ 的上下文规则，只合并紧邻的重复小写。
+    exact=False 时任何被后续大小写转换覆盖的转换都会去掉，
+    少数字符（如 İ、K(开尔文)、ß）的结果可能与原链不同。
+    """
+    kept = list(operations)
+    last_case = None  # 上一个保留的大小写转换的位置
+    for index, operation in enumerate(kept):
+        if isinstance(operation, tuple):
+            continue
+        if last_case is not None:
+            previous = kept[last_case]
+            adjacent = last_case == index - 1
+            if not exact or previous is operation and (operation is str.upper or adjacent):
+                kept[last_case] = None
+        last_case = index
+    
+    # 合并相邻的包裹片段，外层片段包在内层片段之外
+    result = []
+    prefixes, suffixes = [], []
+    for operation in kept:
+        if operation is None:
+            continue
+        if isinstance(operation, tuple):
+            prefixes.append(operation[0])
+            suffixes.append(operation[1])
+            continue
+        if prefixes:
+            result.append(("".join(reversed(prefixes)), "".join(suffixes)))
+            prefixes, suffixes = [], []
+        result.append(operation)
+    if prefixes:
+        result.append(("".join(reversed(prefixes)), "".join(suffixes)))
+    return result
+
+
+@dataclass
+class OptimizationReport:
+    """装饰器链化简报告"""
+    original_layers: int
+    optimized_layers: int
+    
+    @property
+    def removed_layers(self):
+        return self.original_layers - self.optimized_layers
+
+
+def optimize(text_component, exact=True):
+    """将装饰器链改写为等价的最简形式，返回 (新组件, 化简报告)
+
+    多层包裹装饰器合并为一个 TemplateDecorator，被覆盖的大小写转换被移除；
+    叶子组件和无法展开的自定义装饰器原样保留。
+    """
+    leaf, operations = _flatten(text_component)
+    operations = _normalize(operations, exact)
+    optimized = leaf
+    for operation in operations:
+        if isinstance(operation, tuple):
+            optimized = TemplateDecorator(optimized, *operation)
+        else:
+            optimized = _CASE_DECORATORS[operation](optimized)
+    original_layers = 0
+    node = text_component
+    while node is not leaf:
+        original_layers += 1
+        node = node._text_component
+    return optimized, OptimizationReport(original_layers, len(operations))
+
+
+def _wrap_chunks(chunks, prefix, suffix):
+    if prefix:
+        yield prefix
+    yield from chunks
+    if suffix:
+        yield suffix
+
+
+# 希腊字母 Σ 转小写时依赖前后文（词尾变为 ς），流式转小写时保留的上下文长度
+_SIGMA_CONTEXT = 64
+
+
+def _transform_chunks(chunks, transform):
+    """逐段应用大小写转换
+
+    大写是逐字符映射，可以直接逐段转换；小写时含 Σ 的片段要等到足够的后文
+    再连同前文一起转换，保证与整体转换的结果一致（前后文中连续的
+    可忽略大小写字符不超过 _SIGMA_CONTEXT 个时）。
+    """
+    if transform is not str.lower:
+        for chunk in chunks:
+            yield transform(chunk)
+        return
+    
+    before = ""  # 已输出内容末尾的原始文本
+    held = ""  # 含 Σ、等待后文的原始文本
+    for chunk in chunks:
+        if not held and "Σ" not in chunk:
+            yield chunk.lower()
+            before = (before + chunk[-_SIGMA_CONTEXT:])[-_SIGMA_CONTEXT:]
+            continue
+        held += chunk
+        if len(held) <= _SIGMA_CONTEXT:
+            continue
+        cut = len(held) - _SIGMA_CONTEXT
+        yield _lower_in_context(before, held, cut)
+        before = (before + held[max(cut - _SIGMA_CONTEXT, 0):cut])[-_SIGMA_CONTEXT:]
+        held = held[cut:]
+        if "Σ" not in held:
+            yield held.lower()
+            before = (before + held)[-_SIGMA_CONTEXT:]
+            held = ""
+    if held:
+        yield _lower_in_context(before, held, len(held))
+
+
+def _lower_in_context(before, held, end):
+    """在前后文中将 held[:end] 转为小写"""
+    # 除 Σ 外小写映射与上下文无关，Σ 总是映射为一个字符，因此各部分转换后的长度不变
+    start = len(before.lower())
+    return (before + held).lower()[start:start + len(held[:end].lower())]
+
+
+# 编译后的格式渲染器
+class CompiledFormat:
+    """编译后的格式 - 将一组格式预先合并为静态前后缀模板和大小写转换步骤
+
+    相邻的包裹片段在编译时拼接为一个 (前缀, 后缀)，渲染时每个阶段只做一次拼接，
+    不再创建装饰器对象，输出与装饰器链逐字节一致。
+
+    base 为无法展开的内层格式规格（含自定义装饰器时），渲染时先按装饰器链渲染这部分，
+    再在其结果上应用编译后的阶段。
+    """
+    
+    def __init__(self, operations, base=()):
+        self._base = tuple(base)
+        stages = []
+        prefix = suffix = ""
+        for operation in _normalize(operations):
+            if isinstance(operation, tuple):
+                prefix, suffix = operation
+            else:
+                stages.append((prefix, suffix, operation))
+                prefix = suffix = ""
+        if prefix or suffix or not stages:
+            stages.append((prefix, suffix, None))
+        self._stages = tuple(stages)
+    
+    def render(self, text):
+        """渲染单个文本"""
+        if self._base:
+            text = TextEditor.build_component(text, self._base).get_text()
+        for prefix, suffix, transform in self._stages:
+            if prefix or suffix:
+                text = f"{prefix}{text}{suffix}"
+            if transform is not None:
+                text = transform(text)
+        return text
+    
+    __call__ = render
+
+
+def render_iterative(text_component):
+    """迭代渲染 - 将装饰器链展开为操作列表后用显式循环渲染
+
+    结果与递归的 get_text() 一致，但不受解释器递归深度限制；相邻的包裹层
+    合并后一次拼接，渲染耗时与层数成线性关系。无法展开的自定义装饰器
+    及其内部仍按递归方式渲染。
+    """
+    leaf, operations = _flatten(text_component)
+    return CompiledFormat(operations).render(leaf.get_text())
+
+
+def _compile(spec):
+    """编译格式规格 - 逐个格式展开；最后一个无法展开的格式及其内层保留为装饰器链
+
+    工厂返回的组件没有展开回传入的内部组件时（自定义装饰器，或不是装饰器的组件），
+    该格式无法展开，渲染时调用它的 get_text()。
+    """
+    TextEditor.validate_formats(spec)
+    factories = TextEditor._format_factories
+    operations = []
+    base = ()
+    for position, (format_name, *args) in enumerate(spec):
+        inner = PlainText("")
+        node, item_operations = _flatten(factories[format_name](inner, *args))
+        if node is not inner:
+            base = spec[:position + 1]
+            operations = []
+        else:
+            operations.extend(item_operations)
+    return CompiledFormat(operations, base)
+
+
+@lru_cache(maxsize=256)
+def _compile_spec(spec, factories):
+    """按 (格式规格, 各格式的工厂) 缓存编译结果；重新注册格式名称后不会命中旧工厂的编译结果"""
+    return _compile(spec)
+
+
 # 应用场景 - 文本编辑器
 class TextEditor:
     """文本编辑器 - 使用装饰器模式处理文本"""
     
+    # 格式名称 -> 装饰器工厂，工厂以 factory(text_component, *args) 的形式调用
+    _format_factories = {}
+    # 格式名称 -> (最少参数个数, 最多参数个数)
+    _format_arities = {}
+    
     def __init__(self):
         self.formats = []
     
-    def create_formatted_text(self, text, formats):
-        """根据指定的格式创建文本"""
+    @classmethod
+    def register_format(cls, format_name, factory):
+        """注册格式名称及其装饰器工厂，已存在的名称会被覆盖
+
+        无法获取签名的工厂（部分内置函数、functools.partial 等）不校验参数个数。
+        """
+        try:
+            signature = inspect.signature(factory)
+        except (TypeError, ValueError):
+            min_args, max_args = 0, None
+        else:
+            parameters = list(signature.parameters.values())[1:]
+            positional = [p for p in parameters
+                          if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+            min_args = sum(1 for p in positional if p.default is p.empty)
+            if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+                max_args = None
+            else:
+                max_args = len(positional)
+        cls._format_factories[format_name] = factory
+        cls._format_arities[format_name] = (min_args, max_args)
+        # 编译缓存按工厂区分，旧工厂的编译结果不会再命中，这里只是释放它们
+        _compile_spec.cache_clear()
+    
+    @classmethod
+    def validate_formats(cls, formats):
+        """渲染前校验格式列表
+
+        Raises:
+            ValueError: 格式名称未注册或参数个数不匹配时抛出
+        """
+        for item in formats:
+            if not item:
+                raise ValueError("格式不能为空")
+            format_name = item[0]
+            arity = cls._format_arities.get(format_name)
+            if arity is None:
+                raise ValueError(f"不支持的格式: {format_name}")
+            min_args, max_args = arity
+            arg_count = len(item) - 1
+            if arg_count < min_args or (max_args is not None and arg_count > max_args):
+                raise ValueError(f"格式 {format_name} 的参数个数不正确: {arg_count}")
+    
+    @classmethod
+    def build_component(cls, text, formats):
+        """根据指定的格式构建装饰器链"""
+        cls.validate_formats(formats)
+        factories = cls._format_factories
         text_component = PlainText(text)
         
         for format_name, *args in formats:
-            if format_name == "bold":
-                text_component = BoldDecorator(text_component)
-            elif format_name == "italic":
-                text_component = ItalicDecorator(text_component)
-            elif format_name == "underline":
-                text_component = UnderlineDecorator(text_component)
-            elif format_name == "color":
-                text_component = ColorDecorator(text_component, args[0])
-            elif format_name == "prefix":
-                text_component = PrefixDecorator(text_component, args[0])
-            elif format_name == "suffix":
-                text_component = SuffixDecorator(text_component, args[0])
-            elif format_name == "uppercase":
-                text_component = UpperCaseDecorator(text_component)
-            elif format_name == "lowercase":
-                text_component = LowerCaseDecorator(text_component)
+            text_component = factories[format_name](text_component, *args)
+        
+        return text_component
+    
+    def create_formatted_text(self, text, formats):
+        """根据指定的格式创建文本"""
+        return self.build_component(text, formats).get_text()
+    
+    @classmethod
+    def compile_formats(cls, formats):
+        """将格式列表编译为可复用的渲染器，相同规格的编译结果会被缓存
+
+        编译假定工厂是纯函数：结果只取决于内部组件和格式参数，
+        每次以相同参数调用都得到相同结构的装饰器。依赖外部状态的工厂不应使用编译渲染。
+        """
+        spec = tuple(tuple(item) for item in formats)
+        factories = tuple(cls._format_factories.get(item[0]) if item else None for item in spec)
+        try:
+            return _compile_spec(spec, factories)
+        except TypeError:
+            # 参数不可哈希时无法缓存，直接编译
+            return _compile(spec)
+
+
+TextEditor.register_format("bold", BoldDecorator)
+TextEditor.register_format("italic", ItalicDecorator)
+TextEditor.register_format("underline", UnderlineDecorator)
+TextEditor.register_format("color", ColorDecorator)
+TextEditor.register_format("prefix", PrefixDecorator)
+TextEditor.register_format("suffix", SuffixDecorator)
+TextEditor.register_format("uppercase", UpperCaseDecorator)
+TextEditor.register_format("lowercase", LowerCaseDecorator)
+
+
+def _format_chunk(specs, records):
+    """工作进程中渲染一块记录；records 中的格式以 specs 的下标表示"""
+    renderers = [TextEditor.compile_formats(spec) for spec in specs]
+    return [renderers[index].render(text) for text, index in records]
+
+
+# 批量格式化服务
+class BatchFormatter:
+    """批量格式化服务 - 将 (文本, 格式列表) 记录分块分发到进程池并行渲染
+
+    每块记录只携带一次块内用到的格式规格，工作进程按规格缓存编译结果；
+    结果按输入顺序产出，同时在途的块数有上限，输入可以是任意长度的生成器。
+    通过 register_format 注册的自定义格式需在工作进程启动前完成注册（fork 方式下自动继承）。
+    """
+    
+    def __init__(self, workers=None, chunk_size=2000, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or self.workers * 2
+        self._executor = None
+    
+    def format_records(self, records):
+        """按顺序产出每条记录的渲染结果"""
+        if self.workers == 1:
+            for text, formats in records:
+                yield TextEditor.compile_formats(formats).render(text)
+            return
         
-        return text_component.get_text()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        pending = deque()
+        for specs, chunk in self._chunks(records):
+            if len(pending) >= self.max_pending:
+                yield from pending.popleft().result()
+            pending.append(self._executor.submit(_format_chunk, specs, chunk))
+        while pending:
+            yield from pending.popleft().result()
+    
+    def _chunks(self, records):
+        iterator = iter(records)
+        while True:
+            spec_indexes = {}
+            chunk = []
+            for text, formats in islice(iterator, self.chunk_size):
+                spec = tuple(map(tuple, formats))
+                index = spec_indexes.get(spec)
+                if index is None:
+                    index = spec_indexes[spec] = len(spec_indexes)
+                chunk.append((text, index))
+            if not chunk:
+                return
+            yield list(spec_indexes), chunk
+    
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 # 客户端代码
@@ -195,6 +885,47 @@ if __name__ == "__main__":
     )
     print(f"带前后缀: {prefixed_suffixed_text.get_text()}")
     
+    # 批量渲染 - 同一条装饰器链处理多个文本
+    for text in decorated_text.get_texts(f"第{i}行" for i in range(3)):
+        print(f"批量渲染: {text}")
+    
+    # 化简装饰器链 - 合并多层包裹，去掉被覆盖的大小写转换
+    redundant_text = UpperCaseDecorator(
+        BoldDecorator(UpperCaseDecorator(ColorDecorator(decorated_text, "blue")))
+    )
+    optimized_text, report = optimize(redundant_text)
+    print(f"化简前: {redundant_text.get_text()}")
+    print(f"化简后: {optimized_text.get_text()}")
+    print(f"化简报告: {report}, 移除 {report.removed_layers} 层")
+    
+    # 迭代渲染 - 超过递归深度限制的装饰器链
+    deep_text = PlainText("深层")
+    for _ in range(100_000):
+        deep_text = BoldDecorator(deep_text)
+    print(f"迭代渲染 100000 层: 长度 {len(render_iterative(deep_text))}")
+    
+    # 流式渲染 - 将大文本逐段写入文件对象
+    sink = io.StringIO()
+    large_text = ColorDecorator(BoldDecorator(PlainText("正文" * 100_000)), "blue")
+    written = large_text.write_to(sink, chunk_size=4096)
+    print(f"流式写入: {written} 个字符, 与 get_text() 一致: {sink.getvalue() == large_text.get_text()}")
+    
+    # 渲染耗时统计 - 找出耗时最多的装饰器
+    with RenderProfiler() as profiler:
+        for _ in range(1000):
+            decorated_text.get_text()
+    for name, calls, seconds in profiler.report():
+        print(f"耗时统计: {name:<20} {calls:>6} 次 {seconds * 1e3:8.3f} 毫秒")
+    
+    # 渲染缓存 - 共享的子树只渲染一次，修改属性后自动失效
+    cache = TextRenderCache(maxsize=128)
+    shared_base = ItalicDecorator(BoldDecorator(PlainText("共享内容")))
+    for color in ["red", "green", "blue"]:
+        cache.get_text(ColorDecorator(shared_base, color))
+    shared_base._text_component._text_component.text = "修改后的内容"
+    print(f"缓存渲染: {cache.get_text(shared_base)}")
+    print(f"缓存命中: {cache.hits}, 未命中: {cache.misses}, 命中率: {cache.hit_rate:.0%}")
+    
     print("\n=== 装饰器模式应用 - 文本编辑器 ===")
     
     # 使用文本编辑器创建格式化文本
@@ -234,6 +965,35 @@ if __name__ == "__main__":
     )
     print(f"警告: {warning}")
     
+    # 编译格式后重复渲染，结果与装饰器链一致
+    warning_format = editor.compile_formats(
+        [("uppercase",), ("bold",), ("color", "red"), ("suffix", "- 重要警告")]
+    )
+    print(f"编译渲染: {warning_format.render('注意!')}")
+    assert warning_format.render("注意!") == warning
+    
+    # 注册自定义格式
+    TextEditor.register_format(
+        "quote", lambda component, mark="\"": TemplateDecorator(component, mark, mark)
+    )
+    print(f"自定义格式: {editor.create_formatted_text('原话', [('quote',), ('bold',)])}")
+    # 工厂返回的不是装饰器时，编译渲染同样使用它的渲染结果
+    TextEditor.register_format("const", lambda component, text: PlainText(text))
+    const_formats = [("italic",), ("const", "FIXED"), ("bold",)]
+    assert editor.compile_formats(const_formats).render("abc") == \
+        editor.create_formatted_text("abc", const_formats) == "<b>FIXED</b>"
+    try:
+        editor.create_formatted_text("文本", [("blink",)])
+    except ValueError as e:
+        print(f"错误: {e}")
+    
+    # 批量格式化服务 - 多进程并行渲染，结果保持输入顺序
+    records = [(f"记录{i}", [("bold",), ("color", "green")] if i % 2 else [("italic",)])
+               for i in range(6)]
+    with BatchFormatter(workers=2, chunk_size=2) as formatter:
+        for result in formatter.format_records(records):
+            print(f"批量格式化: {result}")
+    
     print("\n=== 装饰器模式的灵活性 ===")
     
     # 根据条件动态添加装饰器
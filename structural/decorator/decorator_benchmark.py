@@ -0,0 +1,317 @@
+"""
+装饰器模式性能测试
+
+在本目录下运行:
+    python decorator_benchmark.py                          # 运行全部测试并打印结果
+    python decorator_benchmark.py --only single depth      # 只运行指定的测试
+    python decorator_benchmark.py --json result.json       # 将结果保存为 JSON
+    python decorator_benchmark.py --compare old.json       # 与之前保存的结果对比
+    python decorator_benchmark.py --profile                # 按装饰器类统计渲染耗时
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from decorator import (
+    PlainText, BoldDecorator, ItalicDecorator, UnderlineDecorator, ColorDecorator,
+    PrefixDecorator, SuffixDecorator, UpperCaseDecorator, LowerCaseDecorator,
+    TextEditor, BatchFormatter, RenderProfiler, render_iterative,
+)
+
+
+# 每种节点的构造方式，参数与实际使用时的规模相当
+NODE_FACTORIES = {
+    PlainText: lambda cls, inner: cls("Hello, World!"),
+    BoldDecorator: lambda cls, inner: cls(inner),
+    ItalicDecorator: lambda cls, inner: cls(inner),
+    UnderlineDecorator: lambda cls, inner: cls(inner),
+    ColorDecorator: lambda cls, inner: cls(inner, "red"),
+    PrefixDecorator: lambda cls, inner: cls(inner, "开始:"),
+    SuffixDecorator: lambda cls, inner: cls(inner, ":结束"),
+    UpperCaseDecorator: lambda cls, inner: cls(inner),
+    LowerCaseDecorator: lambda cls, inner: cls(inner),
+}
+
+
+def with_instance_dict(cls):
+    """生成不带 __slots__ 的子类，作为每个实例都有 __dict__ 的对照组"""
+    return type(f"Dict{cls.__name__}", (cls,), {})
+
+
+def bytes_per_node(cls, factory, count=100_000):
+    """测量每个节点占用的字节数（不含共享的参数字符串）"""
+    inner = PlainText("Hello, World!")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [factory(cls, inner) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # 扣除保存节点的列表本身
+    list_size = nodes.__sizeof__()
+    del nodes
+    return (after - before - list_size) / count
+
+
+def benchmark_memory(count=100_000):
+    results = {}
+    for cls, factory in NODE_FACTORIES.items():
+        results[cls.__name__] = {
+            "slots": bytes_per_node(cls, factory, count),
+            "dict": bytes_per_node(with_instance_dict(cls), factory, count),
+        }
+    return results
+
+
+def build_chain(depth):
+    """构造指定深度的装饰器链，交替使用包裹型和带参数的装饰器"""
+    layers = [BoldDecorator, ItalicDecorator, UnderlineDecorator,
+              lambda inner: ColorDecorator(inner, "red")]
+    text_component = PlainText("Hello, World!")
+    for level in range(depth):
+        text_component = layers[level % len(layers)](text_component)
+    return text_component
+
+
+def time_call(func, *args, min_time=0.2):
+    """返回单次调用的平均耗时（秒）"""
+    timer = timeit.Timer(lambda: func(*args))
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    return elapsed / number
+
+
+def benchmark_depth(depths=(1, 10, 100, 500, 2000, 10_000, 100_000)):
+    """比较递归与迭代渲染在不同深度下的耗时；递归模式超过深度限制时记为 None"""
+    results = {}
+    for depth in depths:
+        chain = build_chain(depth)
+        recursive = None
+        if depth < sys.getrecursionlimit() - 50:
+            recursive = time_call(chain.get_text)
+        results[depth] = {"recursive": recursive, "iterative": time_call(render_iterative, chain)}
+    return results
+
+
+# 每个格式名称对应的示例规格
+FORMAT_SPECS = [
+    ("bold",), ("italic",), ("underline",), ("color", "red"),
+    ("prefix", "开始:"), ("suffix", ":结束"), ("uppercase",), ("lowercase",),
+]
+
+
+def benchmark_dispatch(lengths=(1, 2, 5, 10, 20, 50)):
+    """测量 TextEditor 按格式名称分派的耗时，返回每个格式的平均耗时（秒）
+
+    by_length: 不同长度的格式列表；by_name: 同一格式重复 50 次，检查与名称的注册顺序无关。
+    """
+    by_length = {}
+    for length in lengths:
+        formats = [FORMAT_SPECS[i % len(FORMAT_SPECS)] for i in range(length)]
+        by_length[length] = time_call(TextEditor.build_component, "x", formats) / length
+    by_name = {}
+    for spec in FORMAT_SPECS:
+        formats = [spec] * 50
+        by_name[spec[0]] = time_call(TextEditor.build_component, "x", formats) / 50
+    return {"by_length": by_length, "by_name": by_name}
+
+
+def synthetic_records(count, spec_count=40, seed=0):
+    """生成合成语料：count 条记录，复用 spec_count 种格式组合"""
+    rng = random.Random(seed)
+    specs = [rng.sample(FORMAT_SPECS, rng.randint(1, 5)) for _ in range(spec_count)]
+    for i in range(count):
+        yield f"record {i} " + "lorem ipsum " * rng.randint(1, 8), specs[i % spec_count]
+
+
+def benchmark_batch(worker_counts=(1, 2, 4, 8), count=200_000):
+    """测量 BatchFormatter 在不同进程数下的吞吐量（条/秒）"""
+    results = {}
+    for workers in worker_counts:
+        with BatchFormatter(workers=workers) as formatter:
+            start = time.perf_counter()
+            for _ in formatter.format_records(synthetic_records(count)):
+                pass
+            results[workers] = count / (time.perf_counter() - start)
+    return results
+
+
+# 典型的线上格式组合
+PRODUCTION_SPEC = [
+    ("bold",), ("italic",), ("prefix", "提示:"), ("color", "red"),
+    ("underline",), ("suffix", "[完]"),
+]
+
+
+def benchmark_single():
+    """单个文本的渲染耗时（秒）：递归 get_text、迭代渲染、编译渲染"""
+    chain = TextEditor.build_component("Hello, World!", PRODUCTION_SPEC)
+    compiled = TextEditor.compile_formats(PRODUCTION_SPEC)
+    return {
+        "get_text": time_call(chain.get_text),
+        "render_iterative": time_call(render_iterative, chain),
+        "compiled": time_call(compiled.render, "Hello, World!"),
+    }
+
+
+def benchmark_wide(count=100_000):
+    """大批量文本的单条平均耗时（秒）：逐条构建装饰器链渲染、批量 get_texts、编译渲染"""
+    texts = [f"row {i}" for i in range(count)]
+    chain = TextEditor.build_component("", PRODUCTION_SPEC)
+    compiled = TextEditor.compile_formats(PRODUCTION_SPEC)
+    
+    def one_by_one():
+        for text in texts:
+            TextEditor.build_component(text, PRODUCTION_SPEC).get_text()
+    
+    def batched():
+        for _ in chain.get_texts(texts):
+            pass
+    
+    def compiled_render():
+        for _ in map(compiled.render, texts):
+            pass
+    
+    return {
+        "build_and_get_text": time_call(one_by_one, min_time=0) / count,
+        "get_texts": time_call(batched, min_time=0) / count,
+        "compiled": time_call(compiled_render, min_time=0) / count,
+    }
+
+
+def profile_production_stack(renders=10_000):
+    """按装饰器类统计典型格式组合的渲染耗时"""
+    chain = TextEditor.build_component("Hello, World!", PRODUCTION_SPEC)
+    with RenderProfiler() as profiler:
+        for _ in range(renders):
+            chain.get_text()
+    return profiler.report()
+
+
+BENCHMARKS = {
+    "single": benchmark_single,
+    "depth": benchmark_depth,
+    "wide": benchmark_wide,
+    "dispatch": benchmark_dispatch,
+    "memory": benchmark_memory,
+    "batch": benchmark_batch,
+}
+
+
+def environment():
+    """记录测试环境，便于跨提交对比"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def flatten_results(results, prefix=""):
+    """将嵌套结果展开为 {"a.b.c": 数值}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_results(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(old_results, new_results):
+    """打印两次结果中相同指标的比值（新/旧）"""
+    old = flatten_results(old_results)
+    new = flatten_results(new_results)
+    print(f"{'指标':<40}{'旧':>14}{'新':>14}{'新/旧':>8}")
+    for name in sorted(old.keys() & new.keys()):
+        ratio = new[name] / old[name] if old[name] else float("nan")
+        print(f"{name:<42}{old[name]:>14.6g}{new[name]:>14.6g}{ratio:>8.2f}")
+
+
+def print_results(results):
+    if "single" in results:
+        print("=== 单次渲染耗时 (微秒) ===")
+        for mode, seconds in results["single"].items():
+            print(f"{mode:<18}{seconds * 1e6:>10.2f}")
+    
+    if "wide" in results:
+        print("\n=== 大批量渲染的单条耗时 (微秒) ===")
+        for mode, seconds in results["wide"].items():
+            print(f"{mode:<18}{seconds * 1e6:>10.2f}")
+    
+    if "memory" in results:
+        print("\n=== 每个节点的内存占用 (字节) ===")
+        print(f"{'节点类型':<22}{'__dict__':>10}{'__slots__':>10}{'节省':>8}")
+        for name, result in results["memory"].items():
+            saved = 1 - result["slots"] / result["dict"]
+            print(f"{name:<24}{result['dict']:>10.1f}{result['slots']:>10.1f}{saved:>9.0%}")
+    
+    if "depth" in results:
+        print("\n=== 渲染耗时随深度的变化 (微秒) ===")
+        print(f"{'深度':<10}{'递归':>12}{'迭代':>12}")
+        for depth, result in results["depth"].items():
+            recursive = "递归超限" if result["recursive"] is None else f"{result['recursive'] * 1e6:.1f}"
+            print(f"{depth:<12}{recursive:>12}{result['iterative'] * 1e6:>12.1f}")
+    
+    if "dispatch" in results:
+        print("\n=== TextEditor 格式分派的单格式耗时 (纳秒) ===")
+        for length, seconds in results["dispatch"]["by_length"].items():
+            print(f"{length:>3} 个格式: {seconds * 1e9:8.0f}")
+        for name, seconds in results["dispatch"]["by_name"].items():
+            print(f"{name:>10}: {seconds * 1e9:8.0f}")
+    
+    if "batch" in results:
+        print(f"\n=== BatchFormatter 吞吐量 (条/秒, CPU 核数 {os.cpu_count()}) ===")
+        for workers, throughput in results["batch"].items():
+            print(f"{workers} 个进程: {throughput:12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="装饰器模式性能测试")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="只运行指定的测试")
+    parser.add_argument("--json", metavar="PATH", help="将结果保存为 JSON 文件")
+    parser.add_argument("--compare", metavar="PATH", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--profile", action="store_true", help="按装饰器类统计渲染耗时")
+    args = parser.parse_args()
+    
+    results = {name: BENCHMARKS[name]() for name in args.only or BENCHMARKS}
+    print_results(results)
+    
+    if args.profile:
+        print("\n=== 典型格式组合中各装饰器的自身耗时 ===")
+        for name, calls, seconds in profile_production_stack():
+            print(f"{name:<20}{calls:>8} 次{seconds * 1e3:>10.3f} 毫秒")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.json}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        print("\n=== 与之前的结果对比 ===")
+        # 经过 JSON 往返后键都是字符串，对比前统一格式
+        compare(old["results"], json.loads(json.dumps(results)))